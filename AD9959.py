@@ -1,17 +1,29 @@
 """
 #NOTE: Need to set up RPi Ref Clock first by running:
-#   ./minimal_clk 50.0M -q in [root@tiqi-pi ~]
+#   python AD9959Clock.py 50.0M (or AD9959Clock.start_refclock(50e6))
 
 ### Known Bugs
-* There seems to be a bug at hardware level when sweeping the frequency at an amplitude scaling < 1. The correct current divider scaling is written to the 'CFR' register when initializing the frequency sweep, but after an _io_update call, the value in that register is 0 (i.e. current scaling of 8). By resetting the current scaling right after the _io_update call, this bug is fixed.
+* There seems to be a bug at hardware level when sweeping the frequency at an amplitude scaling < 1. The correct current divider scaling is written to the 'CFR' register when initializing the frequency sweep, but after an _io_update call, the value in that register is 0 (i.e. current scaling of 8). By resetting the current scaling right after the _io_update call, this bug is fixed. Corrupted registers like this can be detected (and repaired) with AD9959.set_write_verify(registers=['CFR', 'FR1'], repair=True).
 """
 
-import spidev 
-import RPi.GPIO as gpio
 from warnings import warn
 import time
+import random
+import threading
+from functools import lru_cache
 import numpy as np
 
+try:
+    import spidev 
+    import RPi.GPIO as gpio
+except ImportError:
+    # Not running on a RPi. Only the simulated backend (see AD9959Sim.py) can be used.
+    spidev = None
+    gpio = None
+
+#Driver version, part of the keys of cached compiled programs (see AD9959Cache.py)
+__version__ = '0.2.0'
+
 IOUPDATE_PIN = 16
 RESET_PIN = 18
 PIN_0 = 15
@@ -27,13 +39,37 @@ _CHPINS = {
 3: 12  #Channel 3
 }
 
-gpio.setmode(gpio.BOARD)
-gpio.setup(IOUPDATE_PIN, gpio.OUT)
-gpio.setup(RESET_PIN, gpio.OUT)
-gpio.setup(PIN_0, gpio.OUT)
-gpio.setup(PIN_1, gpio.OUT)
-gpio.setup(PIN_2, gpio.OUT)
-gpio.setup(PIN_3, gpio.OUT)
+def open_hardware(device=0, fast_gpio=False):
+    """Opens the SPI device and sets up the GPIO pins of the RPi.
+
+    With fast_gpio=True the pins are driven through the GPIO registers (see `AD9959Gpio.GpioMem`) instead of RPi.GPIO, which changes all pins of one call with a single register write.
+
+    ### Returns
+    (spi, gpio) backends to be passed to the AD9959 constructor.
+    """
+
+    assert spidev is not None, 'spidev is required to access the hardware'
+
+    spi = spidev.SpiDev()
+    spi.open(0, device)
+
+    if fast_gpio:
+        from AD9959Gpio import GpioMem
+        pins = GpioMem()
+    else:
+        assert gpio is not None, 'RPi.GPIO is required to access the hardware'
+        pins = gpio
+
+    pins.setmode(pins.BOARD)
+    pins.setup(IOUPDATE_PIN, pins.OUT)
+    pins.setup(RESET_PIN, pins.OUT)
+    pins.setup(PIN_0, pins.OUT)
+    pins.setup(PIN_1, pins.OUT)
+    pins.setup(PIN_2, pins.OUT)
+    pins.setup(PIN_3, pins.OUT)
+    pins.output([IOUPDATE_PIN, RESET_PIN], 0)
+
+    return spi, pins
 
 #Registers
 # Linear sweep: FR1[9:8] = 00, ADF -> what type of sweep, CFR[14]=1
@@ -69,6 +105,26 @@ _registers = {
 READ              = 0x80
 WRITE             = 0x00    
 
+#Serial I/O modes, CSR[2:1] (CSR_LOW_NIBBLE)
+_serial_modes = {
+'2-wire'            :0b0000, # single-bit serial, SDIO_0 bidirectional
+'3-wire'            :0b0010, # single-bit serial, SDIO_0 in, SDIO_2 out
+'2-bit'             :0b0100, # 2-bit serial, SDIO_0:1
+'4-bit'             :0b0110  # 4-bit serial, SDIO_0:3
+}
+
+#Test pattern written to CTW15 by AD9959.test_bus. CTW15 is only used in 16-level modulation.
+_TEST_PATTERN = [0xA5, 0x5A, 0xC3, 0x3C]
+
+#CFR[9:8] bits of the DAC current dividers 1, 2, 4 and 8
+_current_bits = {1: 0b11, 2: 0b01, 4: 0b10, 8: 0b00}
+
+#Shortest time between two steps of an amplitude ramp (in s, see AD9959._step_amplitude)
+_AMPLITUDE_STEP_TIME = 100e-6
+
+#Global registers, not affected by the channel selection in CSR
+_global_registers = ['CSR', 'FR1', 'FR2']
+
 #Register lengths (in bytes)
 _register_len = {
 'CSR'               :1,
@@ -98,27 +154,229 @@ _register_len = {
 'CTW15'             :4
 }
 
+#Registers by their address, to decode the frames of a burst
+_addresses = {address: register for register, address in _registers.items()}
+
+#Channel registers captured in a register image (see AD9959.get_image)
+_image_registers = ['CFR', 'CFTW0', 'CPOW0', 'ACR', 'LSR', 'RDW', 'FDW', 'CTW1']
+
+#Layout of one channel in a register snapshot (see AD9959.get_snapshot)
+_snapshot_dtype = np.dtype([(key, np.uint8, (_register_len[key],)) for key in _registers])
+
+
+#Number of converted values kept by each of the conversion caches below
+_CONVERSION_CACHE_SIZE = 1024
+
+@lru_cache(maxsize=_CONVERSION_CACHE_SIZE)
+def _frequency_bytes(frequency, clock_freq):
+    """Converts a frequency to the 4 bytes of its frequency tuning word at clock_freq. Cached, see AD9959.conversion_cache_info. """
+
+    #Assert frequency lies within allowed range
+    FTW_step = clock_freq/2**32
+    FTW = round(frequency/FTW_step)
+    Min_freq = 0
+    Max_freq = (2**32-1)*FTW_step
+        
+    assert FTW >= 0, 'Minimum frequency is %r' %Min_freq
+    assert FTW <= 2**32, 'Maximum frequency is %r' %Max_freq
+
+    #Write FTW in 4 bytes (CFTW0 is a 32-bit register)
+    return tuple(FTW.to_bytes(4,'big'))
+
+@lru_cache(maxsize=_CONVERSION_CACHE_SIZE)
+def _phase_bytes(phase):
+    """Converts a phase to the 2 bytes of its phase offset word. Cached, see AD9959.conversion_cache_info. """
+
+    assert (phase >= 0 and phase < 359.988), 'Phase must be between 0 and 359.987 degrees'
+
+    #Convert phase into POW
+    POW_step = 0.02197265
+    POW = round(phase/POW_step)
+
+    #Convert POW into bytes
+    BYTE0 = 0x00 | (POW >> 8)
+    BYTE1 = 0xFF & POW
+    return (BYTE0, BYTE1)
+
+@lru_cache(maxsize=_CONVERSION_CACHE_SIZE)
+def _amplitude_word(scale_factor):
+    """Converts an amplitude scale factor to the 10 bit amplitude scale factor word. Cached, see AD9959.conversion_cache_info. """
+
+    assert 0 <= scale_factor <= 1, 'Choose a scale factor in [0,1]'
+
+    return round((2**10-1) * scale_factor)
+
+
+class ChannelState():
+    """Output state of one channel.
+
+    Stores the requested values (frequency in Hz, phase in degree, amplitude scale factor, current divider) together with the quantized tuning words written to the DDS (FTW, POW, ASF), the programmed linear sweep (see AD9959._init_sweep) and the time at which the running ramp ends and its direction ('RU' or 'RD').
+    """
+
+    __slots__ = ['frequency', 'phase', 'amplitude', 'current', 'FTW', 'POW', 'ASF', 'sweep', 'ramp_deadline', 'ramp_direction']
+
+    def __init__(self,):
+        self.frequency = 0
+        self.phase = 0
+        self.amplitude = 1
+        self.current = 1
+        self.FTW = 0
+        self.POW = 0
+        self.ASF = 2**10 - 1
+        self.sweep = None
+        self.ramp_deadline = 0
+        self.ramp_direction = None
+
+
+class PreparedOutput():
+    """A validated and encoded `AD9959.set_output` call, see `AD9959.prepare_output` and `AD9959.set_output_fast`. """
+
+    __slots__ = ['burst', 'csr', 'channels', 'var', 'value', 'word_attr', 'word']
+
+    def __init__(self, burst, csr, channels, var, value, word_attr, word):
+        self.burst = burst
+        self.csr = csr
+        self.channels = channels
+        self.var = var
+        self.value = value
+        self.word_attr = word_attr
+        self.word = word
+
+
+class PreparedScan():
+    """A pre-encoded list of scan points, see `AD9959.prepare_scan` and `AD9959.run_scan`.
+
+    `bursts[i]` is the complete SPI burst (uint8 array) loading point i of all scanned channels. `values` (frequency, phase, amplitude) and `words` (FTW, POW, ASF) have the shape (number of points, number of channels).
+    """
+
+    __slots__ = ['setup', 'bursts', 'channels', 'values', 'words']
+
+    def __init__(self, setup, bursts, channels, values, words):
+        self.setup = setup
+        self.bursts = bursts
+        self.channels = channels
+        self.values = values
+        self.words = words
+
+    def __len__(self):
+        return len(self.bursts)
+
+
+class _EdgeLatch():
+    """Counts edges ('rising' or 'falling') of an input pin between calls of `wait`, see `AD9959.run_scan`. """
+
+    def __init__(self, gpio, pin, edge):
+        self.gpio = gpio
+        self.pin = pin
+        self.level = 1 if edge == 'rising' else 0
+        self.interrupt = hasattr(gpio, 'add_event_detect')
+
+        if self.interrupt:
+            self.edges = threading.Semaphore(0)
+            gpio.add_event_detect(pin, gpio.RISING if edge == 'rising' else gpio.FALLING, callback=lambda channel: self.edges.release())
+        else:
+            self.last = gpio.input(pin)
+
+    def wait(self, timeout=None):
+        """Consumes one edge, waiting for it if none is latched. Returns False after timeout (in s, None waits forever). """
+
+        if self.interrupt:
+            return self.edges.acquire(timeout=timeout)
+
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            current = self.gpio.input(self.pin)
+            edge = current == self.level and self.last != self.level
+            self.last = current
+            if edge:
+                return True
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+
+    def close(self,):
+        if self.interrupt:
+            self.gpio.remove_event_detect(self.pin)
+
+
+class RampCompletion():
+    """Completion of a hardware ramp with the deadline (in time.perf_counter() seconds) at which it ends.
+
+    Use `wait()` to block until the deadline or `await` it in a coroutine.
+    """
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+
+    def remaining(self,):
+        """Returns the time in s until the ramp has finished. """
+
+        return max(self.deadline - time.perf_counter(), 0)
+
+    def done(self,):
+        return self.remaining() == 0
+
+    def wait(self,):
+        """Sleeps until shortly before the deadline, then busy-waits for the rest. """
+
+        remaining = self.remaining()
+        if remaining > 2e-3:
+            time.sleep(remaining - 2e-3)
+        while time.perf_counter() < self.deadline:
+            pass
+
+    def __await__(self):
+        import asyncio
+
+        remaining = self.remaining()
+        if remaining > 2e-3:
+            yield from asyncio.sleep(remaining - 2e-3).__await__()
+        self.wait()
+
 
 class AD9959():
 
-    def __init__(self, device=0):
-        """Constructor. """
+    def __init__(self, device=0, warm_start=False, serial_mode='3-wire', spi_speed=None, spi=None, gpio=None, fast_gpio=False):
+        """Constructor.
 
-        # setup the GPIO
-        self.spi = spidev.SpiDev()
-        self.spi.open(0, device)
+        By default the SPI device and the GPIO pins of the RPi are used (see `open_hardware`, fast_gpio selects the register-level GPIO backend). Other backends with the same interface, e.g. the simulated device in AD9959Sim.py, can be passed as spi and gpio.
 
-        self.CSR_LOW_NIBBLE = 0b0010
+        Setting warm_start=True keeps the current state of the DDS and reads the stored output values back from its registers instead of resetting it.
+        serial_mode must be one of the keys of `_serial_modes`. spi_speed is the SPI clock in Hz (None keeps the spidev default). Both settings are verified with `test_bus` (see `set_bus`).
+        """
+
+        # setup SPI and GPIO
+        if spi is None or gpio is None:
+            spi, gpio = open_hardware(device, fast_gpio)
+        self.spi = spi
+        self.gpio = gpio
+        self.spi.mode = 0
+        self.journal = None
+        self.calibration = None
+
+        #Incremented whenever the stored output state changes, e.g. for caching rendered state
+        self.generation = 0
+
+        #Write verification is off by default. Use self.set_write_verify to change.
+        self._csr = None
+        self._verify_pending = {}
+        self.set_write_verify(fraction=0, registers=[], repair=False)
+
+        self.CSR_LOW_NIBBLE = _serial_modes['3-wire']
         self.FR1_VCO_BYTE = 0x80
            
         #Ref_clock frequency initialised at 50 MHz. Use self.set_refclock to change.
         self.refclock_freq = 50e6
-        self.init_dds(freqmult=10, channels=0)
 
-        self.set_current([0,1,2,3], 1)           
+        if warm_start:
+            self.warm_start()
+        else:
+            self.init_dds(freqmult=10, channels=0)
+            self.set_current([0,1,2,3], 1)           
+
+        self.set_bus(serial_mode, spi_speed, reset=not warm_start)
 
     def __del__(self):
-        gpio.cleanup()
+        self.gpio.cleanup()
 
     def init_dds(self, freqmult=10, channels=0):
         """Resets the status of the DDS, then sets all register entries to default.
@@ -133,12 +391,34 @@ class AD9959():
         self._set_channels(channels)
         self._io_update()
         
-        self.currents = [1, 1, 1, 1]
-        self.frequencies = [0, 0, 0, 0]
-        self.amplitudes = [1, 1, 1, 1]
-        self.phases = [0, 0, 0, 0]
+        self.states = [ChannelState() for channel in range(4)]
+        self.generation += 1
+
+    @property
+    def frequencies(self):
+        """Requested frequencies of all channels as a list [CH0, CH1, CH2, CH3]. """
 
-    def set_output(self, channels, value, var, io_update=False):
+        return [state.frequency for state in self.states]
+
+    @property
+    def amplitudes(self):
+        """Requested amplitude scale factors of all channels as a list [CH0, CH1, CH2, CH3]. """
+
+        return [state.amplitude for state in self.states]
+
+    @property
+    def phases(self):
+        """Requested phases of all channels as a list [CH0, CH1, CH2, CH3]. """
+
+        return [state.phase for state in self.states]
+
+    @property
+    def currents(self):
+        """Current dividers of all channels as a list [CH0, CH1, CH2, CH3]. """
+
+        return [state.current for state in self.states]
+
+    def set_output(self, channels, value, var, io_update=False, ramp_time=None):
         """Set frequency, phase or amplitude of selected channel(s). 
         
         # Function description
@@ -151,6 +431,7 @@ class AD9959():
 
         ### Keyword arguments
         * `io_update` -- Setting `io_update=True` will issue an io update to write the settings into the DDS registers.
+        * `ramp_time` -- Only for `var='amplitude'`. Duration in s of a ramp from the present to the new amplitude, stepped by the host with one IO update per step (see `_step_amplitude`). Blocks for ramp_time. None changes the amplitude instantly.
         
         ### Setting frequency
         `value` must be frequency in Hz. This value is then rounded to a precision of 1 kHz.
@@ -166,11 +447,17 @@ class AD9959():
         #Activate selected channels
         self._set_channels(channels)
 
+        #Keep the frequency of channels resting at the end of a ramp
+        if var != 'frequency':
+            self._park_sweeps([channels] if type(channels) is int else channels)
+
         #Turn off linear sweep
         cfr_bytes = self._read('CFR')
         cfr_bytes[0] = 0
         cfr_bytes[1] &= 0x03 # sets everything except for the last 2 bits to 0
         self._write('CFR', cfr_bytes)
+        for channel in ([channels] if type(channels) is int else channels):
+            self.states[channel].sweep = None
         
         if var == 'frequency':
             register = 'CFTW0'  #Write FTW to CFTW0 register
@@ -184,13 +471,281 @@ class AD9959():
         elif var == 'amplitude':
             register = 'ACR'  # Write to 'ACR' register
             data = self._convert_amplitude(value)
+            if ramp_time is not None:
+                self._step_amplitude([channels] if type(channels) is int else channels, value, ramp_time)
 
-        self._write(register, data)
-        self._update(var, channels, value)
+        #With a flatness calibration the amplitude is written per channel by _level
+        if self.calibration is None or var != 'amplitude':
+            self._write(register, data)
+        self._update(var, channels, value, data)
+        if self.calibration is not None and var != 'phase':
+            # state.ASF now holds the uncorrected word, so a new amplitude is always written
+            self._level([channels] if type(channels) is int else channels, force=var == 'amplitude')
 
         if io_update:
             self._io_update()
 
+    def set_calibration(self, calibration):
+        """Sets the amplitude flatness calibration (see AD9959Calibration.py) applied by `set_output` and `ramp_frequency`, or turns it off with None.
+
+        The amplitudes of all channels are releveled immediately.
+        """
+
+        self.calibration = calibration
+        self._level([0, 1, 2, 3], force=True)
+        self._io_update()
+
+    def _level(self, channels, force=False):
+        """Writes the amplitude of channels corrected for the flatness calibration at their current frequency.
+
+        Only channels whose amplitude scale factor word changes are written (all with force=True). The previously selected channels are selected again afterwards. No IO update is issued.
+
+        ### Returns
+        True if any register was written.
+        """
+
+        csr = self._csr
+        written = False
+        for channel in channels:
+            state = self.states[channel]
+            amplitude = state.amplitude
+            if self.calibration is not None:
+                amplitude *= self.calibration.correction(channel, state.frequency, self.clock_freq)
+            ASF = _amplitude_word(amplitude)
+            if ASF == state.ASF and not force:
+                continue
+
+            self._set_channels(channel)
+            data = self._convert_amplitude(amplitude)
+            self._write('ACR', data)
+            state.ASF = ASF
+            written = True
+
+        if written and csr is not None:
+            self._write('CSR', [csr])
+
+        return written
+
+    def channel_mask(self, channels):
+        """Validates channels (single int or list of channels in [0, 1, 2, 3]) and returns the CSR byte selecting them. """
+
+        if type(channels) is int:
+            channels = [channels]
+        assert type(channels) is list, 'Channels must be int or list'
+        for channel in channels:
+            assert channel in [0, 1, 2, 3], 'channels must be between 0, 1, 2 or 3'
+
+        mask = 0
+        for channel in set(channels):
+            mask |= 2**channel
+
+        return mask << 4 | self.CSR_LOW_NIBBLE
+
+    def prepare_output(self, channels, value, var, sweep_off=True):
+        """Validates and encodes a `set_output` call once, for replaying it with `set_output_fast`.
+
+        # Function description
+        All checks and conversions of `set_output` are done here, e.g. when building a sequence. The returned `PreparedOutput` contains the complete SPI burst (channel selection, CFR with linear sweep turned off if sweep_off=True, and the CFTW0/CPOW0/ACR register) and the precomputed tuning word.
+        CFR and ACR are read once to build the burst. The prepared output must not be reused after changing the current divider, the ACR ramp settings or the clock frequency. Channels resting at the end of a frequency ramp (see `ramp_frequency`) and the flatness calibration (see `set_calibration`) are not handled.
+
+        ### Returns
+        `PreparedOutput`
+        """
+
+        csr = self.channel_mask(channels)
+        channels = [channel for channel in range(4) if csr >> (channel + 4) & 1]
+
+        if var == 'frequency':
+            register, word_attr = 'CFTW0', 'FTW'
+            value = int(np.round(value / 1e3) * 1e3) # round frequency to 1 kHz.
+            data = self._convert_frequency(value)
+            word = int.from_bytes(bytes(data), 'big')
+        elif var == 'phase':
+            register, word_attr = 'CPOW0', 'POW'
+            data = self._convert_phase(value)
+            word = (data[0] & 0x3F) << 8 | data[1]
+        elif var == 'amplitude':
+            register, word_attr = 'ACR', 'ASF'
+            self._set_channels(channels[0])
+            data = self._convert_amplitude(value)
+            word = (data[1] & 0x03) << 8 | data[2]
+        else:
+            raise AssertionError("var must be 'frequency', 'phase' or 'amplitude'")
+
+        burst = []
+        if sweep_off:
+            for channel in channels:
+                cfr_bytes = self._read_channel(channel, 'CFR')
+                cfr_bytes[0] = 0
+                cfr_bytes[1] &= 0x03
+                burst += self._frame('CSR', [2**channel << 4 | self.CSR_LOW_NIBBLE]) + self._frame('CFR', cfr_bytes)
+        burst += self._frame('CSR', [csr]) + self._frame(register, data)
+
+        return PreparedOutput(burst, csr, channels, var, value, word_attr, word)
+
+    def set_output_fast(self, prepared, io_update=False):
+        """Writes a `PreparedOutput` (see `prepare_output`), or a list of them, in a single SPI transfer without any validation.
+
+        Updates the channel states like `set_output`. Written registers are not verified (see `set_write_verify`).
+        """
+
+        if type(prepared) is list:
+            if not prepared:
+                return
+            burst = [byte for output in prepared for byte in output.burst]
+        else:
+            prepared = [prepared]
+            burst = prepared[0].burst
+
+        self.spi.writebytes2(burst)
+        self._csr = prepared[-1].csr
+
+        for output in prepared:
+            for channel in output.channels:
+                state = self.states[channel]
+                setattr(state, output.var, output.value)
+                setattr(state, output.word_attr, output.word)
+                state.sweep = None
+        self.generation += 1
+
+        if io_update:
+            self._io_update()
+
+    def prepare_scan(self, channels, points, cache=None):
+        """Validates and encodes the points of an externally triggered scan (see `run_scan`).
+
+        # Function description
+        Every point sets frequency, phase and amplitude of all scanned channels. The SPI bursts of all points are encoded at once, so that `run_scan` only has to send one prebuilt burst per point. Frequencies are not rounded to 1 kHz (unlike `set_output`). The flatness calibration (see `set_calibration`) is applied to the amplitudes.
+        CFR and ACR are read once to build the bursts. The prepared scan must not be reused after changing the current divider, the ACR ramp settings or the clock frequency.
+
+        ### Arguments
+        * `channels` -- single int or list of channels in [0, 1, 2, 3].
+        * `points` -- array of shape (number of points, number of channels, 3) (or (number of points, 3) for a single channel) of (frequency in Hz, phase in degree, amplitude scale factor).
+        * `cache` -- `AD9959Cache.ProgramCache`. The encoded bursts are taken from (or stored in) the cache, keyed by the points, the read registers, the clock configuration, the calibration and `__version__`.
+
+        ### Returns
+        `PreparedScan`
+        """
+
+        if type(channels) is int:
+            channels = [channels]
+        self.channel_mask(channels)
+
+        points = np.asarray(points, dtype=float)
+        if points.ndim == 2:
+            points = points[:, np.newaxis, :]
+        assert points.ndim == 3 and points.shape[1:] == (len(channels), 3), 'points must have the shape (number of points, %d, 3)' % len(channels)
+        assert len(points) > 0, 'points must contain at least one point'
+
+        setup = []
+        acr = []
+        for channel in channels:
+            cfr_bytes = self._read_channel(channel, 'CFR')
+            cfr_bytes[0] = 0
+            cfr_bytes[1] &= 0x03
+            setup += self._frame('CSR', [2**channel << 4 | self.CSR_LOW_NIBBLE]) + self._frame('CFR', cfr_bytes)
+            acr.append(self._read('ACR'))
+
+        def encode():
+            frequencies, phases, amplitudes = points[..., 0], points[..., 1], points[..., 2]
+            assert (phases >= 0).all() and (phases < 359.988).all(), 'Phase must be between 0 and 359.987 degrees'
+            assert (amplitudes >= 0).all() and (amplitudes <= 1).all(), 'Choose a scale factor in [0,1]'
+
+            FTW = np.round(frequencies / (self.clock_freq/2**32)).astype(np.int64)
+            assert (FTW >= 0).all() and (FTW < 2**32).all(), 'Frequency must be between 0 and %r' % ((2**32-1)*self.clock_freq/2**32)
+            POW = np.round(phases / 0.02197265).astype(np.int64)
+
+            leveled = amplitudes.copy()
+            if self.calibration is not None:
+                for k, channel in enumerate(channels):
+                    leveled[:, k] *= [self.calibration.correction(channel, frequency, self.clock_freq) for frequency in frequencies[:, k]]
+            ASF = np.round((2**10-1) * leveled).astype(np.int64)
+
+            #One frame of 14 bytes per channel: CSR, CFTW0, CPOW0 and ACR
+            bursts = np.empty((len(points), len(channels), 14), dtype=np.uint8)
+            for k, channel in enumerate(channels):
+                frame = bursts[:, k]
+                frame[:, 0] = _registers['CSR']
+                frame[:, 1] = 2**channel << 4 | self.CSR_LOW_NIBBLE
+                frame[:, 2] = _registers['CFTW0']
+                for i in range(4):
+                    frame[:, 3 + i] = FTW[:, k] >> 8*(3 - i) & 0xFF
+                frame[:, 7] = _registers['CPOW0']
+                frame[:, 8] = POW[:, k] >> 8
+                frame[:, 9] = POW[:, k] & 0xFF
+                frame[:, 10] = _registers['ACR']
+                frame[:, 11] = acr[k][0]
+                frame[:, 12] = (acr[k][1] | 0b00010000) & 0b11111100 | ASF[:, k] >> 8
+                frame[:, 13] = ASF[:, k] & 0xFF
+
+            return bursts.reshape(-1)
+
+        if cache is None:
+            bursts = encode()
+        else:
+            from AD9959Cache import program_key
+            calibration = None if self.calibration is None else [self.calibration.resolution, self.calibration.tables]
+            key = program_key('scan', __version__, points, channels, self.clock_freq, self.CSR_LOW_NIBBLE, setup, acr, calibration)
+            bursts = cache.get_or_compile(key, encode)
+
+        #Tuning words of every point, decoded from the bursts
+        frames = bursts.reshape(len(points), len(channels), 14).astype(np.int64)
+        FTW = frames[..., 3] << 24 | frames[..., 4] << 16 | frames[..., 5] << 8 | frames[..., 6]
+        POW = (frames[..., 8] & 0x3F) << 8 | frames[..., 9]
+        ASF = (frames[..., 12] & 0x03) << 8 | frames[..., 13]
+
+        return PreparedScan(np.array(setup, dtype=np.uint8), bursts.reshape(len(points), -1), channels,
+                            np.moveaxis(points, 2, 0), np.stack([FTW, POW, ASF]))
+
+    def run_scan(self, scan, trigger_pin, edge='rising', timeout=None):
+        """Steps through a `PreparedScan` (see `prepare_scan`) on edges of an external trigger.
+
+        # Function description
+        The first point is loaded into the buffered registers of the DDS before the first edge. On every edge of trigger_pin (BOARD numbering) the loaded point is applied with an IO update and the next point is loaded, so the latency of a point is a single prebuilt SPI write. Blocks until all points are applied or no edge arrives within timeout.
+        Edges are latched by the edge detection of the GPIO backend (`add_event_detect`), so an edge arriving while the previous point is still being written is applied right afterwards instead of being lost. Backends without edge detection (e.g. `AD9959Gpio.GpioMem`) poll the trigger pin, keeping its level between points, and can still miss pulses shorter than a SPI write.
+
+        ### Arguments
+        * `scan` -- `PreparedScan`
+        * `trigger_pin` -- GPIO input pin of the trigger.
+        * `edge` -- 'rising' or 'falling'
+        * `timeout` -- Maximum time in s to wait for each edge, None waits forever.
+
+        ### Returns
+        Number of applied points.
+        """
+
+        assert edge in ['rising', 'falling'], "edge must be 'rising' or 'falling'"
+
+        self.gpio.setup(trigger_pin, self.gpio.IN)
+        self.spi.writebytes2(np.concatenate([scan.setup, scan.bursts[0]]))
+
+        applied = 0
+        trigger = _EdgeLatch(self.gpio, trigger_pin, edge)
+        try:
+            for i in range(len(scan)):
+                if not trigger.wait(timeout):
+                    break
+                self._toggle_pin(IOUPDATE_PIN)
+                applied += 1
+                if i + 1 < len(scan):
+                    self.spi.writebytes2(scan.bursts[i + 1])
+        finally:
+            trigger.close()
+
+        #Every burst ends with the frame of the last channel, which is left selected
+        self._csr = int(scan.bursts[0][-13])
+        if applied:
+            frequencies, phases, amplitudes = scan.values[:, applied - 1]
+            FTW, POW, ASF = scan.words[:, applied - 1]
+            for k, channel in enumerate(scan.channels):
+                state = self.states[channel]
+                state.frequency, state.phase, state.amplitude = float(frequencies[k]), float(phases[k]), float(amplitudes[k])
+                state.FTW, state.POW, state.ASF = int(FTW[k]), int(POW[k]), int(ASF[k])
+                state.sweep = None
+            self.generation += 1
+
+        return applied
+
     def set_freqsweeptime(self, channels, start_freq, end_freq, sweeptime, no_dwell=False, ioupdate=False, trigger=False):
         """Activates linear frequency sweep mode. 
 
@@ -213,14 +768,233 @@ class AD9959():
             self.set_current([0, 1, 2, 3], 1, ioupdate=True)
             if trigger:
                 PINS = self.select_CHPINS(channels)
-                gpio.output(PINS, 0)
-                gpio.output(PINS, 1)
+                self.gpio.output(PINS, 0)
+                self.gpio.output(PINS, 1)
+                self._start_ramp(channels, 'RU')
                 
 
+    def set_phasesweeptime(self, channels, start_phase, end_phase, sweeptime, no_dwell=False, ioupdate=False, trigger=False):
+        """Activates linear phase sweep mode.
+
+        Sweeping from start_phase to end_phase (in degree) with a duration of sweeptime (in seconds). Delta word and ramp rate are chosen with `_solve_sweep`, so the sweep runs on the DDS at SYNC_CLK resolution.
+        To reset phase to start_phase after sweep, set no_dwell=True
+        Setting ioupdate=True will issue an ioupdate to write the settings into the DDS registers
+        Setting trigger=True will immediately trigger the ramp by setting the channel pins to high.
+        Note that trigger only works if ioupdate is also set to True.
+        """
+
+        POW_step = 0.02197265
+        span = abs(round(end_phase/POW_step) - round(start_phase/POW_step))
+        RDW, rate = self._solve_sweep(span, sweeptime)
+        RDW = min(RDW, 2**14 - 1)
+
+        self._init_sweep(scan_type='phase', channels=channels, start_val=start_phase, end_val=end_phase, RSS=RDW*POW_step, RSI=rate*4/self.clock_freq, no_dwell=no_dwell)
+
+        if ioupdate:
+            self._io_update()
+            if trigger:
+                PINS = self.select_CHPINS(channels)
+                self.gpio.output(PINS, 0)
+                self.gpio.output(PINS, 1)
+                self._start_ramp(channels, 'RU')
+
+    def ramp_frequency(self, channels, frequency, sweeptime=50e-3):
+        """Ramps the frequency of the selected channel(s) from their current value to frequency within sweeptime (in s).
+
+        # Function description
+        If a channel already has a ramp between its current frequency and the new frequency with the same sweeptime programmed (see `program_ramp`), the ramp is started by setting the channel pin only, without any SPI traffic. Otherwise the ramp is programmed once with `program_ramp` (two bursts with one IO update each, a ramp down writes 8 bytes more per channel).
+        With a flatness calibration (see `set_calibration`) the amplitude is leveled for the new frequency when the ramp starts.
+
+        ### Returns
+        `RampCompletion` of the started ramps.
+        """
+
+        if type(channels) is int:
+            channels = [channels]
+
+        up = []
+        down = []
+        for channel in channels:
+            f0 = self.states[channel].frequency
+            if frequency == f0:
+                continue
+
+            sweep = self.states[channel].sweep
+            if sweep is None or sweep['type'] != 'frequency' or sweep.get('sweeptime') != sweeptime \
+                    or sorted([f0, frequency]) != [sweep['low_freq'], sweep['high_freq']]:
+                self.program_ramp(channel, min(f0, frequency), max(f0, frequency), sweeptime, start='low' if f0 < frequency else 'high')
+
+            if frequency > f0:
+                up.append(channel)
+            elif frequency < f0:
+                down.append(channel)
+
+        self._update('frequency', channels, frequency, self._convert_frequency(frequency))
+        if self.calibration is not None and self._level(up + down):
+            self._io_update()
+
+        completion = RampCompletion(0)
+        for direction, group in [('RU', up), ('RD', down)]:
+            if group:
+                completion = RampCompletion(max(completion.deadline, self.set_ramp_direction(group, direction).deadline))
+
+        return completion
+
+    def program_ramp(self, channels, low_freq, high_freq, sweeptime, start='low', rise_time=None):
+        """Programs a bidirectional linear frequency ramp between low_freq and high_freq (in Hz).
+
+        # Function description
+        Writes start/end frequency, rising (RDW) and falling (FDW) delta words and ramp rates of the selected channel(s) in a single SPI burst with one IO update. The channels then move between both frequencies by their channel pin only: pin high ramps up within rise_time, pin low ramps down within sweeptime (see `set_ramp_direction`). The ramp words are chosen with `_solve_sweep`. rise_time defaults to sweeptime.
+
+        The channel is left at start ('low' or 'high'). Resting at the high frequency needs the rising ramp to be completed once, so in that case the rising delta word and ramp rate are first set to a single step and the real values are written in the second burst (see below).
+
+        The DAC current divider is written from the channel state together with the sweep settings. Because of the hardware bug described at the top of this file, the IO update clears it anyway, so CFR is written again in a second short burst followed by another IO update.
+        """
+
+        assert start in ['low', 'high'], "start must be 'low' or 'high'"
+        if rise_time is None:
+            rise_time = sweeptime
+        if type(channels) is int:
+            channels = [channels]
+
+        start_FTW = int.from_bytes(bytes(self._convert_frequency(low_freq)), 'big')
+        end_FTW = int.from_bytes(bytes(self._convert_frequency(high_freq)), 'big')
+        assert start_FTW < end_FTW, 'low_freq must be smaller than high_freq'
+
+        RDW, RSRR = self._solve_sweep(end_FTW - start_FTW, rise_time)
+        FDW, FSRR = self._solve_sweep(end_FTW - start_FTW, sweeptime)
+
+        burst = []
+        repair = []
+
+        #Set modulation level to two-level modulation (FR1[9:8]=00)
+        FR1_BYTES = self._read('FR1')
+        if FR1_BYTES[1] & 0b00000011:
+            FR1_BYTES[1] &= 0b11111100
+            burst += self._frame('FR1', FR1_BYTES)
+
+        for channel in channels:
+            self._set_channels(channel)
+            CFR_BYTES = self._read('CFR')
+            #AFP select frequency sweep (CFR[23:22]=10), linear sweep enable (CFR[14]=1), current divider from channel state
+            CFR_BYTES[0] = 0x80
+            CFR_BYTES[1] = 0x40 | _current_bits[self.states[channel].current]
+
+            burst += self._frame('CSR', [2**channel << 4 | self.CSR_LOW_NIBBLE])
+            burst += self._frame('CFR', CFR_BYTES)
+            repair += self._frame('CSR', [2**channel << 4 | self.CSR_LOW_NIBBLE])
+            repair += self._frame('CFR', CFR_BYTES)
+            if start == 'high':
+                repair += self._frame('RDW', list(RDW.to_bytes(4, 'big')))
+                repair += self._frame('LSR', [FSRR, RSRR])
+            burst += self._frame('CFTW0', list(start_FTW.to_bytes(4, 'big')))
+            burst += self._frame('CTW1', list(end_FTW.to_bytes(4, 'big')))
+            burst += self._frame('FDW', list(FDW.to_bytes(4, 'big')))
+            if start == 'high':
+                burst += self._frame('RDW', list((end_FTW - start_FTW).to_bytes(4, 'big')))
+                burst += self._frame('LSR', [FSRR, 1])
+            else:
+                burst += self._frame('RDW', list(RDW.to_bytes(4, 'big')))
+                burst += self._frame('LSR', [FSRR, RSRR])
+
+            self.states[channel].sweep = {'type': 'frequency', 'start': start_FTW, 'end': end_FTW,
+                                    'RDW': RDW, 'FDW': FDW, 'RSRR': RSRR, 'FSRR': FSRR,
+                                    'low_freq': low_freq, 'high_freq': high_freq, 'sweeptime': sweeptime}
+
+        PINS = self.select_CHPINS(channels)
+        self.gpio.output(PINS, 1 if start == 'high' else 0)
+        self._write_burst(burst)
+        self._toggle_pin(IOUPDATE_PIN)
+
+        #Rewrite the current divider cleared by the IO update (and the real rising ramp when resting at the high frequency)
+        #The registers of both bursts are verified after the second IO update only, when CFR is repaired
+        self._write_burst(repair)
+        self._io_update()
+
+        self._csr = 2**channels[-1] << 4 | self.CSR_LOW_NIBBLE
+        self.generation += 1
+
+    def _solve_sweep(self, span, sweeptime):
+        """Chooses delta word and ramp rate of a linear sweep over span (in tuning word units) lasting sweeptime (in s).
+
+        The sweep takes ceil(span/delta)*rate SYNC_CLK cycles (SYNC_CLK = clock_freq/4). All ramp rates 1-255 are tried and the pair with the duration closest to sweeptime is returned (the smallest ramp rate, i.e. the smoothest ramp, on ties).
+
+        ### Returns
+        (delta word, ramp rate)
+        """
+
+        cycles = sweeptime*self.clock_freq/4
+        assert cycles >= 1, 'sweeptime must be at least %r s' %(4/self.clock_freq)
+
+        best = None
+        for rate in range(1, 256):
+            delta = min(max(round(span*rate/cycles), 1), 2**32 - 1)
+            error = abs(-(-span // delta)*rate - cycles)
+            if best is None or error < best[0]:
+                best = (error, delta, rate)
+
+        return best[1], best[2]
+
+    def _step_amplitude(self, channels, amplitude, ramp_time):
+        """Steps the amplitude of channels from their present scale factor word towards amplitude (corrected for the flatness calibration) within ramp_time (in s).
+
+        # Function description
+        The automatic amplitude ramp of the ACR only ramps between 0 and the scale factor under control of a profile pin (FR1[11:10]), and the profile pins already start the frequency ramps. So the ramp is stepped by the host instead: every `_AMPLITUDE_STEP_TIME` (at most one step per scale factor word) the intermediate words of all channels are written in one SPI burst followed by an IO update.
+        The last step, i.e. the new amplitude itself, is left to the caller. The previously selected channels are selected again afterwards.
+        """
+
+        assert ramp_time >= 0, 'ramp_time must not be negative'
+
+        csr = self._csr
+        ramps = []
+        for channel in channels:
+            state = self.states[channel]
+            target = amplitude
+            if self.calibration is not None:
+                target *= self.calibration.correction(channel, state.frequency, self.clock_freq)
+            self._set_channels(channel)
+            ramps.append((channel, state.ASF, _amplitude_word(target) - state.ASF, self._read('ACR')))
+
+        steps = min(max([abs(span) for channel, ASF, span, acr in ramps] + [1]), max(int(ramp_time/_AMPLITUDE_STEP_TIME), 1))
+        t0 = time.perf_counter()
+        for k in range(1, steps):
+            burst = []
+            for channel, ASF, span, acr in ramps:
+                ASF += round(span*k/steps)
+                acr[1] = (acr[1] & 0b11110100) | 0b00010000 | ASF >> 8 # multiplier on, automatic ramp off
+                acr[2] = ASF & 0xFF
+                burst += self._frame('CSR', [2**channel << 4 | self.CSR_LOW_NIBBLE]) + self._frame('ACR', acr)
+                self.states[channel].ASF = ASF
+            self.spi.writebytes2(burst)
+            delay = t0 + k*ramp_time/steps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._toggle_pin(IOUPDATE_PIN)
+
+        if csr is not None:
+            self._write('CSR', [csr])
+        delay = t0 + ramp_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _park_sweeps(self, channels):
+        """Writes the current frequency to CFTW0 of channels with a programmed frequency ramp, so turning off the sweep does not change their frequency. """
+
+        parked = False
+        for channel in channels:
+            state = self.states[channel]
+            if state.sweep is not None and state.sweep['type'] == 'frequency' and state.FTW != state.sweep['start']:
+                self._set_channels(channel)
+                self._write('CFTW0', list(state.FTW.to_bytes(4, 'big')))
+                parked = True
+
+        if parked:
+            self._set_channels(channels)
+
     def set_ampsweeptime(self, channels, start_scale, end_scale, sweeptime, no_dwell=False, ioupdate=False, trigger=False):
         """Activates linear amplitude sweep mode. 
 
-        Sweeping from start_scale to end_scale with a duration of sweeptime.
+        Sweeping from start_scale to end_scale with a duration of sweeptime. For simple amplitude changes use `set_output(..., var='amplitude', ramp_time=...)`, which ramps in both directions without a linear sweep setup.
         To reset amplitude to start_scale after sweep, set no_dwell=True
         Setting ioupdate=True will issue an ioupdate to write the settings into the DDS registers.
         Setting trigger=True will immediately trigger the ramp by setting the channel pins to high.
@@ -230,93 +1004,433 @@ class AD9959():
         step_interval = 2e-6 #1us
         steps = sweeptime/step_interval #Number of steps
         step_size = (end_scale-start_scale)/steps
-        print(steps)
         
-        self._init_sweep(scan_type='amplitude', channels=channels, start_val=start_scale, end_val=end_scale, RSS=step_size, RSI=step_interval, no_dwell=no_dwell, ioupdate=ioupdate, trigger=trigger)
+        self._init_sweep(scan_type='amplitude', channels=channels, start_val=start_scale, end_val=end_scale, RSS=step_size, RSI=step_interval, no_dwell=no_dwell)
         
         #IOUPDATE and Start
         if ioupdate:
             self._io_update()
             if trigger:
                 PINS = self.select_CHPINS(channels)
-                gpio.output(PINS, 0)
-                gpio.output(PINS, 1)
+                self.gpio.output(PINS, 0)
+                self.gpio.output(PINS, 1)
+                self._start_ramp(channels, 'RU')
 
-    def get_frequency(self,):
+    def get_frequency(self, exact=False):
         """Returns the frequency values set in all channels as a list. 
 
         The values' position indicate the corresponding channel: [CH0, CH1, CH2, CH3]
+        With exact=True, the actual output frequencies computed from the stored frequency tuning words are returned instead of the requested values.
         """
-        
-        #TODO:
-            #Find way to appropriately reconvert the frequency to its initial
-            #Value or alert that the value is APPROXIMATE
-        FTW = int (0)
-        freq = int(0)
-        
-        FTW_bytes = self._read('CFTW0')
-        FTW = FTW.from_bytes(FTW_bytes,'big')
-        freq = FTW*self.clock_freq/2**32
-        
-        print('Latest frequency set: ', "{:.2e}".format(freq), 'Hz')
-        print(['%.2e' % elem for elem in self.frequencies])
-        
+
+        if exact:
+            return [state.FTW*self.clock_freq/2**32 for state in self.states]
+
         return self.frequencies
 
-    def get_phase(self,):    
+    def get_phase(self, exact=False):    
         """Returns the phase values set in all channels as a list. 
 
         The values' position indicate the corresponding channel: [CH0, CH1, CH2, CH3]
+        With exact=True, the actual phases computed from the stored phase offset words are returned instead of the requested values.
         """
-        
-        #for comparison
-        initial_state = self._read('CPOW0')
-        
-        POW_step = 0.02197265
-        POW = 0x00 | initial_state[0] << 8| initial_state [1]
-        phase = round(POW*POW_step, 2)
-        
-        print ('Latest phase set (i.e. currently in register):', phase)
-        
+
+        if exact:
+            return [state.POW*360/2**14 for state in self.states]
+
         return self.phases
 
-    def get_amplitude(self,):
+    def get_amplitude(self, exact=False):
         """Returns the amplitude values set in all channels as a list. 
 
         The values' position indicate the corresponding channel: [CH0, CH1, CH2, CH3]
+        With exact=True, the actual scale factors computed from the stored amplitude scale factors are returned instead of the requested values.
         """
-                
-        data = self._read('ACR')
-        BYTE1 = data[1]
-        BYTE2 = data[2]
-        
-        ASF = (0x03 & BYTE1) << 8 | BYTE2
-        ASF_step = 0.00097751
-        scale_factor = ASF*ASF_step
-        
-        if scale_factor == 0:
-            print ('Latest scale_factor set (i.e. currently in register):', 1)
-        else:
-            print ('Latest scale_factor set (i.e. currently in register):', scale_factor)
+
+        if exact:
+            return [state.ASF/(2**10 - 1) for state in self.states]
 
         return self.amplitudes
 
     def get_state(self, form='hex'):
-        """Prints all values in DDS registers in hex or bin format. The default format is 'hex' but can be changed to 'bin' """
+        """Prints all values in DDS registers of all channels in hex or bin format and returns them (see `get_snapshot`). The default format is 'hex' but can be changed to 'bin' """
         
         assert (form == 'hex') or (form == 'bin')
-        
-        if form == 'hex':
+
+        fmt = '0x{:02x}' if form == 'hex' else '{:08b}'
+        snapshot = self.get_snapshot()
+
+        for channel in range(4):
+            print('Channel', channel)
             for key in _registers:
-                print(key, ['0x{:02x}'.format(b) for b in self._read(key)])
-        else:
+                print(key, [fmt.format(b) for b in snapshot[channel][key]])
+
+        return snapshot
+
+    def get_snapshot(self,):
+        """Reads the full register file of all 4 channels in a single full-duplex SPI transfer.
+
+        # Function description
+        The transfer selects each channel in turn and reads all registers in `_registers`. Afterwards channel 3 is left selected.
+
+        ### Returns
+        NumPy structured array of shape (4,) with dtype `_snapshot_dtype`. Row i holds the register bytes as seen with channel i selected, e.g. `snapshot[1]['CFTW0']`. Use `decode_snapshot` to convert it to output values.
+        """
+
+        tx = []
+        for channel in range(4):
+            tx += self._frame('CSR', [2**channel << 4 | self.CSR_LOW_NIBBLE])
+            for key in _registers:
+                tx += [READ | _registers[key]] + [0]*_register_len[key]
+
+        rx = self.spi.xfer2(tx)
+        self._csr = 2**3 << 4 | self.CSR_LOW_NIBBLE
+
+        snapshot = np.zeros(4, dtype=_snapshot_dtype)
+        pos = 0
+        for channel in range(4):
+            pos += 1 + _register_len['CSR']
             for key in _registers:
-                print(key, ['{:08b}'.format(b) for b in self._read(key)])
+                snapshot[channel][key] = rx[pos + 1:pos + 1 + _register_len[key]]
+                pos += 1 + _register_len[key]
+
+        return snapshot
+
+    def decode_snapshot(self, snapshot):
+        """Converts a register snapshot (see `get_snapshot`) to output values.
+
+        ### Returns
+        dict {'freqmult': <int>, 'frequencies': [...], 'phases': [...], 'amplitudes': [...], 'currents': [...], 'FTWs': [...], 'POWs': [...], 'ASFs': [...]} where the lists are ordered [CH0, CH1, CH2, CH3]. Frequencies are computed with the current self.refclock_freq.
+        """
+
+        freqmult = (int(snapshot[0]['FR1'][0]) & 0b01111100) >> 2
+        if freqmult == 0:
+            freqmult = 1
+        clock_freq = freqmult*self.refclock_freq
+
+        dividers = {0b11: 1, 0b01: 2, 0b10: 4, 0b00: 8}
+        state = {'freqmult': freqmult, 'frequencies': [], 'phases': [], 'amplitudes': [], 'currents': [], 'FTWs': [], 'POWs': [], 'ASFs': []}
+
+        for channel in snapshot:
+            FTW = int.from_bytes(bytes(channel['CFTW0']), 'big')
+            POW = int.from_bytes(bytes(channel['CPOW0']), 'big') & 0x3FFF
+            ACR = channel['ACR']
+            if ACR[1] & 0b00010000:
+                ASF = (int(ACR[1]) & 0x03) << 8 | int(ACR[2])
+            else:
+                ASF = 2**10 - 1
+            amplitude = ASF/(2**10-1)
+
+            state['frequencies'].append(FTW*clock_freq/2**32)
+            state['phases'].append(POW*360/2**14)
+            state['amplitudes'].append(amplitude)
+            state['currents'].append(dividers[int(channel['CFR'][1]) & 0x03])
+            state['FTWs'].append(FTW)
+            state['POWs'].append(POW)
+            state['ASFs'].append(ASF)
+
+        return state
+
+    def warm_start(self,):
+        """Takes over the current state of the DDS without resetting it.
+
+        Reads all registers with one `get_snapshot` call and sets the frequency multiplier, clock frequency and stored output values from it.
+        """
+
+        state = self.decode_snapshot(self.get_snapshot())
+
+        self.freqmult = state['freqmult']
+        self.clock_freq = self.refclock_freq*self.freqmult
+        self.states = [ChannelState() for channel in range(4)]
+        for channel, channel_state in enumerate(self.states):
+            channel_state.frequency = state['frequencies'][channel]
+            channel_state.phase = state['phases'][channel]
+            channel_state.amplitude = state['amplitudes'][channel]
+            channel_state.current = state['currents'][channel]
+            channel_state.FTW = state['FTWs'][channel]
+            channel_state.POW = state['POWs'][channel]
+            channel_state.ASF = state['ASFs'][channel]
+        self.generation += 1
             
+    def get_image(self, channels=[0, 1, 2, 3]):
+        """Returns a snapshot of the register image and stored output values of the selected channels.
+
+        # Function description
+        Reads FR1 and the channel registers listed in `_image_registers` of every selected channel with one `get_snapshot` call. The snapshot can be stored (e.g. as json) and restored later with `compile_image` and `load_image`.
+
+        ### Arguments
+        * `channels` -- single int or list of channels in [0, 1, 2, 3].
+
+        ### Returns
+        dict {'FR1': <bytes>, 'registers': {<channel>: {<register>: <bytes>}}, 'outputs': {<channel>: {'frequency', 'amplitude', 'phase', 'current'}}}
+        """
+
+        if type(channels) is int:
+            channels = [channels]
+
+        snapshot = self.get_snapshot()
+
+        image = {'FR1': [int(b) for b in snapshot[0]['FR1']], 'registers': {}, 'outputs': {}}
+        for channel in channels:
+            image['registers'][str(channel)] = {key: [int(b) for b in snapshot[channel][key]] for key in _image_registers}
+            state = self.states[channel]
+            if state.sweep is not None and state.sweep['type'] == 'frequency':
+                # a channel resting at the end of a ramp is stored at its present frequency (see `_park_sweeps`)
+                image['registers'][str(channel)]['CFTW0'] = list(state.FTW.to_bytes(4, 'big'))
+            image['outputs'][str(channel)] = {'frequency': state.frequency,
+                                              'amplitude': state.amplitude,
+                                              'phase': state.phase,
+                                              'current': state.current}
+
+        return image
+
+    def compile_image(self, image):
+        """Compiles a register image (see `get_image`) into a single SPI burst.
+
+        The burst selects every channel of the image in turn and writes all its registers. Linear sweeps are turned off in the written CFR like in `set_output`, so the channels hold the stored outputs whatever the level of their profile pins. It does not contain the IO update.
+        """
+
+        burst = self._frame('FR1', image['FR1'])
+        for channel, registers in sorted(image['registers'].items()):
+            burst += self._frame('CSR', [2**int(channel) << 4 | self.CSR_LOW_NIBBLE])
+            for key in _image_registers:
+                data = list(registers[key])
+                if key == 'CFR':
+                    data[0] = 0
+                    data[1] &= 0x03
+                burst += self._frame(key, data)
+
+        return burst
+
+    def load_image(self, image, burst=None, ioupdate=True):
+        """Restores a register image (see `get_image`) with one SPI burst and one IO update.
+
+        If `burst` is given it must be the output of `compile_image(image)`, which then is not recompiled. The stored output values are restored from the image, self.freqmult and self.clock_freq are derived from its FR1 (with the current self.refclock_freq) and the profile pins of its channels are set low.
+        """
+
+        if burst is None:
+            burst = self.compile_image(image)
+
+        self._write_burst(burst)
+        if image['registers']:
+            # the burst leaves the last channel of the image selected
+            self._csr = 2**int(sorted(image['registers'])[-1]) << 4 | self.CSR_LOW_NIBBLE
+            self.gpio.output([_CHPINS[int(channel)] for channel in image['registers']], 0)
+
+        freqmult = (image['FR1'][0] & 0b01111100) >> 2
+        self.freqmult = freqmult if freqmult else 1
+        self.clock_freq = self.refclock_freq*self.freqmult
+
+        for channel, output in image['outputs'].items():
+            registers = image['registers'][channel]
+            state = self.states[int(channel)]
+            state.frequency = output['frequency']
+            state.amplitude = output['amplitude']
+            state.phase = output['phase']
+            state.current = output['current']
+            state.FTW = int.from_bytes(bytes(registers['CFTW0']), 'big')
+            state.POW = int.from_bytes(bytes(registers['CPOW0']), 'big') & 0x3FFF
+            state.ASF = (registers['ACR'][1] & 0x03) << 8 | registers['ACR'][2] if registers['ACR'][1] & 0b00010000 else 2**10 - 1
+            state.sweep = None
+        self.generation += 1
+
+        if ioupdate:
+            self._io_update()
+
+    def set_bus(self, serial_mode=None, spi_speed=None, reset=True):
+        """Sets the serial I/O mode of the DDS and the SPI clock speed and verifies them with `test_bus`.
+
+        # Function description
+        serial_mode must be one of '2-wire', '3-wire', '2-bit' or '4-bit' (see `_serial_modes`). spi_speed is given in Hz. Arguments that are None are left unchanged.
+        If the readback test fails, the previous SPI clock speed and serial mode are restored. If the DDS cannot be addressed in the previous serial mode either, it is reset with `init_dds` in 3-wire mode, unless reset=False (e.g. after a warm start, whose state must be kept).
+
+        Note that the 2-bit and 4-bit modes need all SDIO lines wired to the RPi and a SPI driver operating in dual/quad mode.
+
+        ### Returns
+        True if the new settings passed the readback test, False otherwise.
+        """
+
+        old_nibble = self.CSR_LOW_NIBBLE
+        old_speed = self.spi.max_speed_hz
+
+        if spi_speed is not None:
+            self.spi.max_speed_hz = int(spi_speed)
+        if serial_mode is not None:
+            assert serial_mode in _serial_modes, 'serial_mode must be one of %r' %list(_serial_modes)
+            self._set_channels(0)
+            self.CSR_LOW_NIBBLE = _serial_modes[serial_mode]
+
+        if self.test_bus():
+            return True
+
+        warn('SPI readback test failed for serial_mode=%r, spi_speed=%r. Restoring previous settings.' %(serial_mode, spi_speed))
+        self.spi.max_speed_hz = old_speed
+        if self.CSR_LOW_NIBBLE != old_nibble:
+            self.CSR_LOW_NIBBLE = old_nibble
+            self._set_channels(0)
+            if self.test_bus():
+                return False
+
+            if reset:
+                self.CSR_LOW_NIBBLE = _serial_modes['3-wire']
+                self.init_dds(freqmult=self.freqmult)
+                self.set_current([0,1,2,3], 1)
+            else:
+                warn('The DDS cannot be addressed in the previous serial mode and was not reset (reset=False).')
+
+        return False
+
+    def test_bus(self,):
+        """Writes `_TEST_PATTERN` to CTW15 of channel 0, reads it back and restores the previous content of CTW15. Returns True if the pattern was read back correctly.
+
+        Reads return the active registers, which take over a write to the buffered registers only with the next IO update (the same model as `_verify`). The pattern and the restored value are therefore each followed by an IO update, which also applies all other writes issued since the last IO update.
+        """
+
+        self._set_channels(0)
+        original = list(self._read('CTW15'))
+        self._write('CTW15', _TEST_PATTERN)
+        self._toggle_pin(IOUPDATE_PIN)
+        readback = self._read('CTW15')
+        self._write('CTW15', original)
+        self._toggle_pin(IOUPDATE_PIN)
+
+        return list(readback) == _TEST_PATTERN
+
+    def measure_throughput(self, n=1000):
+        """Measures the SPI throughput with the current bus settings.
+
+        Rewrites the current CFTW0 register of channel 0 n times (the output does not change).
+
+        ### Returns
+        (writes per second, bytes per second)
+        """
+
+        self._set_channels(0)
+        data = self._read('CFTW0')
+
+        t0 = time.perf_counter()
+        for i in range(n):
+            self._write('CFTW0', data)
+        dt = time.perf_counter() - t0
+
+        return n/dt, n*(1 + _register_len['CFTW0'])/dt
+
+    def set_write_verify(self, fraction=0, registers=['CFR', 'FR1'], repair=False):
+        """Configures the verification of written registers.
+
+        # Function description
+        Registers written with `_write` and `_write_burst` are read back after the next IO update and compared with the written values. Every write to one of `registers` is verified, all other writes are verified with probability `fraction`. Mismatches are counted in self.verify_stats and reported with a warning. Verification costs one read per verified register and channel, so fraction=0 and registers=[] turns it off completely.
+
+        ### Arguments
+        * `fraction` -- Fraction between 0 and 1 of randomly sampled writes to verify.
+        * `registers` -- List of registers that are always verified, e.g. ['CFR', 'FR1'].
+        * `repair` -- If True, mismatching registers are rewritten and an additional IO update is issued.
+        """
+
+        assert 0 <= fraction <= 1, 'fraction must be between 0 and 1'
+        for register in registers:
+            assert register in _registers and register != 'CSR', '%r is not a valid register to verify.' %register
+
+        self.verify_fraction = fraction
+        self.verify_registers = list(registers)
+        self.verify_repair = repair
+        self.verify_stats = {'checked': 0, 'mismatches': 0, 'repaired': 0}
+
+    def _verify(self,):
+        """Reads back all registers queued for verification by `_write` and compares them with the written values. See `set_write_verify`.
+
+        Reads return the active registers, which take over a write to the buffered registers only with the IO update (the same model as `test_bus`), so this is called by `_io_update` right after the IO update.
+        """
+
+        pending = self._verify_pending
+        self._verify_pending = {}
+        csr = self._csr
+        repaired = False
+
+        for (channel_csr, register), data in pending.items():
+            if register in _global_registers:
+                channels = [None]
+            else:
+                channels = [channel for channel in range(4) if (channel_csr or 0) >> (channel + 4) & 1]
+
+            for channel in channels:
+                if channel is not None:
+                    self._write('CSR', [2**channel << 4 | self.CSR_LOW_NIBBLE])
+                readback = self._read(register)
+                self.verify_stats['checked'] += 1
+
+                if list(readback) != list(data):
+                    self.verify_stats['mismatches'] += 1
+                    warn('Register %r of channel %r reads %r instead of %r' %(register, channel, list(readback), list(data)))
+                    if self.verify_repair:
+                        self.spi.writebytes([_registers[register]] + list(data))
+                        self.verify_stats['repaired'] += 1
+                        repaired = True
+
+        if csr is not None:
+            self._write('CSR', [csr])
+        if repaired:
+            self._toggle_pin(IOUPDATE_PIN)
+
+    def enable_journal(self, path, segment_size=2**24, max_segments=8):
+        """Records all public calls, SPI frames and GPIO edges in a journal (see AD9959Journal.py).
+
+        The journal is written to the memory-mapped segment files <path>.0000, <path>.0001, ... of segment_size bytes each. Only the newest max_segments segments are kept. Use `python AD9959Journal.py <path>` to replay it.
+        """
+
+        from AD9959Journal import Journal, JournalSpi, JournalGpio
+
+        self.disable_journal()
+        self.journal = Journal(path, segment_size=segment_size, max_segments=max_segments)
+        self.spi = JournalSpi(self.spi, self.journal)
+        self.gpio = JournalGpio(self.gpio, self.journal)
+
+        for name in dir(type(self)):
+            if name.startswith('_') or name in ['enable_journal', 'disable_journal'] or not callable(getattr(type(self), name)):
+                continue
+            setattr(self, name, self._journaled(getattr(self, name)))
+
+    def disable_journal(self,):
+        """Stops recording and closes the journal. """
+
+        if self.journal is None:
+            return
+
+        for name in list(vars(self)):
+            if getattr(vars(self)[name], '_journaled', False):
+                delattr(self, name)
+
+        self.spi = self.spi.spi
+        self.gpio = self.gpio.gpio
+        self.journal.close()
+        self.journal = None
+
+    def _journaled(self, method):
+        """Wraps a public method such that its calls are recorded in the journal. Nested public calls are not recorded. """
+
+        journal = self.journal
+
+        def wrapper(*args, **kwargs):
+            if journal.depth == 0:
+                journal.call(method.__name__, args, kwargs)
+            journal.depth += 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                journal.depth -= 1
+
+        wrapper._journaled = True
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
     def reset(self,):
         """Resets the status of the DDS, sets all register entries to default. Also resets the stored values from set_ functions to default. """
 
         self._toggle_pin(RESET_PIN)                  
+
+        #All channels are enabled after a reset
+        self._csr = 0xF0
+        self._verify_pending = {}
     
     def _set_channels(self, channels, ioupdate=False):
         """Activates one or multiple channels to write settings to.
@@ -364,24 +1478,47 @@ class AD9959():
         
         return channels    
         
-    def set_refclock(self, frequency):  
+    def set_refclock(self, frequency, retune=False):  
         """ Sets the class variable self.refclock_freq.
 
         Automatically updates class variable self.clock_freq with new refclock frequency. Must pass frequency in Hz (i.e 50MHz = 50e6 Hz). Prints out current values for self.refclock_freq, self.freqmult and self.clock_freq
+        Setting retune=True rewrites the tuning words of all channels for the new clock frequency in one SPI burst with one IO update (see `_retune_burst`).
         """
         
+        clock_freq = getattr(self, 'clock_freq', None)
         self.refclock_freq = frequency
         self.clock_freq = self.freqmult*self.refclock_freq
+        _frequency_bytes.cache_clear()
         if (self.clock_freq < 99.999e6 or self.clock_freq > 500.001e6):
             warn('Clock frequency out of range. Use set_freqmult to set clock \
                  frequency between 100MHz and 500MHz')
         print ('Refclock =', "{:.2e}".format(frequency), 'Hz \nFreqmult =', self.freqmult,
                '\nClock Frequency =', "{:.2e}".format(self.clock_freq), 'Hz')
+
+        if retune and clock_freq:
+            self._write_burst(self._retune_burst(clock_freq))
+            self._io_update()
                 
-    def set_freqmult(self, freqmult, ioupdate=False):
+    def start_refclock(self, frequency=50e6, clock=0, source=None, mash=0, source_freqs=None):
+        """Sets the reference clock output of the RPi (see AD9959Clock.py) and updates self.refclock_freq with the achieved frequency.
+
+        Allows retuning the reference clock at runtime. The arguments are passed to `AD9959Clock.GpClock.set_frequency`, source_freqs overrides the detected clock source frequencies (see `AD9959Clock.source_frequencies`).
+
+        ### Returns
+        Achieved reference clock frequency in Hz.
+        """
+
+        from AD9959Clock import start_refclock
+
+        refclock_freq = start_refclock(frequency, clock=clock, source=source, mash=mash, source_freqs=source_freqs)
+        self.set_refclock(refclock_freq)
+
+        return refclock_freq
+
+    def set_freqmult(self, freqmult, ioupdate=False, retune=False):
         """ Sets the frequency multiplier on the DDS.
 
-        Automatically updates self.clock_freq with new freqmult. When changing the frequency multiplier the channel frequencies must be reset.
+        Automatically updates self.clock_freq with new freqmult. When changing the frequency multiplier the channel frequencies must be reset, unless retune=True is set: then FR1 and the tuning words of all channels for the new clock frequency (see `_retune_burst`) are written in one SPI burst followed by one IO update.
         
         Frequency multiplier must be between 4 and 20 or equal to 1 (turns off multiplier)
         Frequency multiplier must be chosen such that self.clock_freq lies between 100MHz and 500MHz.
@@ -419,16 +1556,66 @@ class AD9959():
         #data for FR1 register
         new_state = [BYTE0, BYTE1, BYTE2]
         #write new state into register
-        self._write('FR1', new_state)
+        if not retune:
+            self._write('FR1', new_state)
         
         #Set new freqmult value and print clock information
+        clock_freq = getattr(self, 'clock_freq', None)
         self.freqmult = freqmult
         self.clock_freq = self.refclock_freq*self.freqmult
+        _frequency_bytes.cache_clear()
         print ('Refclock =', "{:.2e}".format(self.refclock_freq), 'Hz \nFreqmult =', self.freqmult,
                '\nClock Frequency =', "{:.2e}".format(self.clock_freq), 'Hz')
+
+        if retune:
+            self._write_burst(self._frame('FR1', new_state) + (self._retune_burst(clock_freq) if clock_freq else []))
+            ioupdate = True
     
         if ioupdate:
             self._io_update()
+
+    def _retune_burst(self, clock_freq):
+        """Returns the SPI burst that restores the output of all channels after the clock frequency changed from clock_freq to self.clock_freq.
+
+        # Function description
+        The frequency tuning word of every channel is recomputed from its stored frequency. Programmed linear sweeps keep their frequencies and timing: frequency words (start, end, RDW and FDW of frequency sweeps) are scaled by the ratio of the clock frequencies and the ramp rates (LSR) by its inverse. The burst does not contain the IO update.
+        """
+
+        ratio = clock_freq/self.clock_freq
+        burst = []
+        for channel, state in enumerate(self.states):
+            burst += self._frame('CSR', [2**channel << 4 | self.CSR_LOW_NIBBLE])
+            state.FTW = int.from_bytes(bytes(self._convert_frequency(state.frequency)), 'big')
+
+            sweep = state.sweep
+            if sweep is None:
+                burst += self._frame('CFTW0', list(state.FTW.to_bytes(4, 'big')))
+                continue
+
+            if sweep['type'] == 'frequency':
+                if 'low_freq' in sweep:
+                    sweep['start'] = int.from_bytes(bytes(self._convert_frequency(sweep['low_freq'])), 'big')
+                    sweep['end'] = int.from_bytes(bytes(self._convert_frequency(sweep['high_freq'])), 'big')
+                else:
+                    sweep['start'] = min(round(sweep['start']*ratio), 2**32 - 1)
+                    sweep['end'] = min(round(sweep['end']*ratio), 2**32 - 1)
+                sweep['RDW'] = min(max(round(sweep['RDW']*ratio), 1), 2**32 - 1)
+                sweep['FDW'] = min(max(round(sweep['FDW']*ratio), 1), 2**32 - 1)
+                burst += self._frame('CFTW0', list(sweep['start'].to_bytes(4, 'big')))
+                burst += self._frame('CTW1', list(sweep['end'].to_bytes(4, 'big')))
+                burst += self._frame('RDW', list(sweep['RDW'].to_bytes(4, 'big')))
+                burst += self._frame('FDW', list(sweep['FDW'].to_bytes(4, 'big')))
+            else:
+                burst += self._frame('CFTW0', list(state.FTW.to_bytes(4, 'big')))
+
+            sweep['RSRR'] = min(max(round(sweep['RSRR']/ratio), 1), 255)
+            sweep['FSRR'] = min(max(round(sweep['FSRR']/ratio), 1), 255)
+            burst += self._frame('LSR', [sweep['FSRR'], sweep['RSRR']])
+
+        self._csr = 2**3 << 4 | self.CSR_LOW_NIBBLE
+        self.generation += 1
+
+        return burst
         
     def get_freqmult(self,):
         """Returns current value of frequency multiplier. """
@@ -481,7 +1668,8 @@ class AD9959():
         if type(channels) is int:
             channels = [channels]
         for channel in channels:
-            self.currents[channel] = divider
+            self.states[channel].current = divider
+        self.generation += 1
 
         if ioupdate:
             self._io_update()
@@ -511,12 +1699,13 @@ class AD9959():
         return self.currents
     
     def _init_sweep(self, scan_type, channels, start_val, end_val, RSS, RSI, FSS='same', FSI='same', no_dwell=False):
-        """Turns on amplitude or frequency linear sweep mode and programs the settings as passed.
+        """Turns on amplitude, frequency or phase linear sweep mode and programs the settings as passed.
 
+        scan_type: 'amplitude', 'frequency' or 'phase'
         channels: single channel or list of channels from [0, 1, 2, 3],
-        start_val: starting amplitude (between 0 and 1) or frequency
-        end_val: final amplitude or frequency
-        RSS: Rising Step Size (between 0 and 1)
+        start_val: starting amplitude (between 0 and 1), frequency or phase
+        end_val: final amplitude, frequency or phase
+        RSS: Rising Step Size (between 0 and 1, in Hz or in degree)
         RSI: Rising Step Interval (limited by clock frequency, RSI_min = 1/(self.clock_freq/4), RSI_max = 255/(self.clock_freq/4))
         FSS: Falling Step Size (if not given, takes same value as RSS)
         FSI: Falling Step Interval (if not given, takes same value as RSI)
@@ -535,13 +1724,13 @@ class AD9959():
         if FSS == 'same': FSS = RSS
         if FSI == 'same': FSI = RSI  
 
-        #Assert RSI and FSI are in allowed ranges. Compute and print allowed ranges.
+        #Assert RSI and FSI are in allowed ranges (ramp rates 1-255 SYNC_CLK cycles). Compute and print allowed ranges.
         RSI_min = 1/(self.clock_freq/4)
         RSI_max = 255/(self.clock_freq/4)
-        assert RSI > RSI_min, 'RSI is set below minimum: %r s. To lower minimum, clock frequency needs to be increased' %RSI_min
-        assert FSI > RSI_min, 'FSI is set below minimum: %r s. To lower minimum, clock frequency needs to be increased' %RSI_min
-        assert RSI < RSI_max, 'RSI is set above maximum: %r s. To increase maximum, clock frequency needs to be decreased' %RSI_max
-        assert FSI < RSI_max, 'FSI is set above maximum: %r s. To increase maximum, clock frequency needs to be decreased' %RSI_max
+        assert round(RSI*self.clock_freq/4) >= 1, 'RSI is set below minimum: %r s. To lower minimum, clock frequency needs to be increased' %RSI_min
+        assert round(FSI*self.clock_freq/4) >= 1, 'FSI is set below minimum: %r s. To lower minimum, clock frequency needs to be increased' %RSI_min
+        assert round(RSI*self.clock_freq/4) <= 255, 'RSI is set above maximum: %r s. To increase maximum, clock frequency needs to be decreased' %RSI_max
+        assert round(FSI*self.clock_freq/4) <= 255, 'FSI is set above maximum: %r s. To increase maximum, clock frequency needs to be decreased' %RSI_max
 
         #Activate selected channels
         self._set_channels(channels)
@@ -554,9 +1743,13 @@ class AD9959():
 
         #Input sweep settings
         if scan_type == 'frequency':
-            self._init_freq_sweep(start_val, end_val, RSS, FSS, no_dwell)
+            start_word, end_word, RDW, FDW = self._init_freq_sweep(start_val, end_val, RSS, FSS, no_dwell)
         elif scan_type == 'amplitude':
-            self._init_amp_sweep(start_val, end_val, RSS, FSS, no_dwell)
+            start_word, end_word, RDW, FDW = self._init_amp_sweep(start_val, end_val, RSS, FSS, no_dwell)
+        elif scan_type == 'phase':
+            start_word, end_word, RDW, FDW = self._init_phase_sweep(start_val, end_val, RSS, FSS, no_dwell)
+        else:
+            raise AssertionError("scan_type must be 'amplitude', 'frequency' or 'phase'")
 
         #Set Linear Sweep Ramp Rates (LSR):
         LSR_BYTES = [0, 0]
@@ -572,6 +1765,14 @@ class AD9959():
         
         self._write('LSR', LSR_BYTES)
 
+        #Store the programmed words for computing the sweep duration (see sweep_duration)
+        if type(channels) is int:
+            channels = [channels]
+        for channel in set(channels):
+            self.states[channel].sweep = {'type': scan_type, 'start': start_word, 'end': end_word,
+                                    'RDW': RDW, 'FDW': FDW, 'RSRR': RSRR, 'FSRR': FSRR}
+        self.generation += 1
+
     def _init_amp_sweep(self, start_scale, end_scale, RSS, FSS, no_dwell): 
         #Assert start_scale, end_scale, RSS and FSS are between min and max values, like in set_amplitude
         ASF_step = 1/(2**10 - 1) #Corrected bug. ASF_step must not be 1/2**10 to avoid writing 11 bits into 10 bit register, when setting scale to 1.
@@ -638,6 +1839,8 @@ class AD9959():
         self._write('RDW', RDW_BYTES)
         self._write('FDW', FDW_BYTES)
 
+        return start_ASF, end_ASF, RDW, FDW
+
     def _init_freq_sweep(self, start_freq, end_freq, RSS, FSS, no_dwell):   
         FTW_step = self.clock_freq/2**32
         Min_freq = 0
@@ -695,6 +1898,53 @@ class AD9959():
         self._write('CTW1', CTW1_BYTES)
         self._write('RDW', RDW_BYTES)
         self._write('FDW', FDW_BYTES)
+
+        return start_FTW, end_FTW, RDW, FDW
+
+    def _init_phase_sweep(self, start_phase, end_phase, RSS, FSS, no_dwell):
+        #Assert start_phase, end_phase, RSS and FSS are between min and max values, like in set_phase
+        POW_step = 0.02197265
+
+        start_POW = round(start_phase/POW_step)
+        assert start_POW >= 0, 'Minimum start_phase is 0'
+        end_POW = round(end_phase/POW_step)
+        assert end_POW > 0, 'Minimum end_phase is %r' %POW_step
+        RDW = round(RSS/POW_step)
+        assert RDW > 0, 'Minimum RSS is %r' %POW_step
+        FDW = round(FSS/POW_step)
+        assert FDW > 0, 'Minimum FSS is %r' %POW_step
+
+        assert start_POW < end_POW, 'start_phase must be smaller than end_phase'
+        assert end_POW < 2**14, 'Maximum end_phase is 359.987 degrees'
+        assert RDW < 2**14, 'Maximum RSS is 359.987 degrees'
+        assert FDW < 2**14, 'Maximum FSS is 359.987 degrees'
+
+        #Setting up linear sweep mode
+        CFR_initial = self._read('CFR')
+        CFR_BYTES = [0, 0, 0]
+        #Set AFP select to phase sweep (CFR[23:22]=11)
+        CFR_BYTES[0] = 0xC0
+        #Enable Linear Sweep (CFR[14]=1) (copy last two bits)
+        CFR_BYTES[1] = 0x40 | (0x03 & CFR_initial[1])
+        #Enable no-dwell if true: CFR[15]=1 else 0
+        CFR_BYTES[1] = CFR_BYTES[1] | no_dwell << 7
+        #Copy BYTE2 from initial state
+        CFR_BYTES[2] = CFR_initial[2]
+
+        #Start point in CPOW0[13:0], end point in CTW1[31:18], RDW in RDW[31:18], FDW in FDW[31:18]
+        #NOTE: Must be MSB aligned
+        CPOW0_BYTES = list(start_POW.to_bytes(2, 'big'))
+        CTW1_BYTES = list((end_POW << 18).to_bytes(4, 'big'))
+        RDW_BYTES = list((RDW << 18).to_bytes(4, 'big'))
+        FDW_BYTES = list((FDW << 18).to_bytes(4, 'big'))
+
+        self._write('CFR', CFR_BYTES)
+        self._write('CPOW0', CPOW0_BYTES)
+        self._write('CTW1', CTW1_BYTES)
+        self._write('RDW', RDW_BYTES)
+        self._write('FDW', FDW_BYTES)
+
+        return start_POW, end_POW, RDW, FDW
         
     def sweep_loop(self, channels, reps, interval):
         """Initiates a loop of reps PIN toggles with an interval between every toggle. channels indicates which channel PINS should be toggled. Interval indicates the interval between every toggle in seconds.
@@ -704,9 +1954,9 @@ class AD9959():
                 
         for i in range(reps):
             time.sleep(interval)
-            gpio.output(PINS, 0)
+            self.gpio.output(PINS, 0)
             time.sleep(interval)
-            gpio.output(PINS, 1)
+            self.gpio.output(PINS, 1)
             i += 1
             if i ==1:
                 print ('1st cycle')
@@ -717,7 +1967,7 @@ class AD9959():
             else:
                 print ('%rth cycle' %i)
             
-        gpio.output(PINS, 0)
+        self.gpio.output(PINS, 0)
 
     def select_CHPINS(self, channels):
         assert (type(channels) is int) or (type(channels) is list), 'channels must be passed as int or list'
@@ -747,6 +1997,39 @@ class AD9959():
         # send the bytes we write to the register
         self.spi.writebytes(data)   
 
+        if register == 'CSR':
+            self._csr = data[0]
+        elif register in self.verify_registers or (self.verify_fraction and random.random() < self.verify_fraction):
+            self._verify_pending[(self._csr, register)] = list(data)
+
+    def _frame(self, register, data):
+        """Returns the list of bytes writing data into register, to be sent with `_write_burst`. """
+
+        assert register in _registers, '%r is not a valid register. Register must be passed as string.' %register
+        assert len(data) == _register_len[register], 'Must pass %r byte(s) to %r register.' %(_register_len[register], register)
+
+        return [_registers[register]] + list(data)
+
+    def _write_burst(self, burst):
+        """Sends a list of bytes made of several `_frame`s in a single SPI transfer.
+
+        The written registers are queued for verification like in `_write` (see `set_write_verify`).
+        """
+
+        self.spi.writebytes2(burst)
+
+        if self.verify_registers or self.verify_fraction:
+            csr = self._csr
+            i = 0
+            while i < len(burst):
+                register = _addresses[burst[i] & 0x1F]
+                data = list(burst[i + 1:i + 1 + _register_len[register]])
+                if register == 'CSR':
+                    csr = data[0]
+                elif register in self.verify_registers or (self.verify_fraction and random.random() < self.verify_fraction):
+                    self._verify_pending[(csr, register)] = data
+                i += 1 + _register_len[register]
+
     def _read(self, register):
         """Returns list of bytes (data), currently stored in register. """
         
@@ -758,88 +2041,187 @@ class AD9959():
         #return values in register
         return self.spi.readbytes(_register_len[register])
 
+    def _read_channel(self, channel, register):
+        """Selects a single channel and returns the bytes of register. """
+
+        self._write('CSR', [2**channel << 4 | self.CSR_LOW_NIBBLE])
+        return self._read(register)
+
     def _io_update(self,):
         """ Toggles IO_UPDATE pin on the RPi to load all commands to the DDS sent since last ioupdate. """
 
         self._toggle_pin(IOUPDATE_PIN)
 
+        if self._verify_pending:
+            self._verify()
+
     def set_ramp_direction(self, channels, direction):
+        """Sets the channel pins high (direction='RU', ramp up) or low (direction='RD', ramp down).
+
+        Returns a `RampCompletion` for the ramps started on channels with a programmed linear sweep.
+        """
+
         PINS = self.select_CHPINS(channels)
 
         if direction == 'RU':
-            gpio.output(PINS, 1)
+            self.gpio.output(PINS, 1)
         elif direction == 'RD':
-            gpio.output(PINS, 0)
+            self.gpio.output(PINS, 0)
+
+        return self._start_ramp(channels, direction)
+
+    def sweep_duration(self, channel, direction='RU'):
+        """Returns the exact duration in s of the programmed linear sweep of channel in direction 'RU' or 'RD'.
+
+        The sweep accumulator steps by RDW (FDW) every RSRR (FSRR) SYNC_CLK cycles (SYNC_CLK = clock_freq/4) until it reaches the end (start) word. Returns 0 if no sweep is programmed.
+        """
+
+        sweep = self.states[channel].sweep
+        if sweep is None:
+            return 0
+
+        span = abs(sweep['end'] - sweep['start'])
+        if direction == 'RU':
+            steps, rate = -(-span // sweep['RDW']), sweep['RSRR']
+        else:
+            steps, rate = -(-span // sweep['FDW']), sweep['FSRR']
+
+        return steps*rate*4/self.clock_freq
+
+    def _start_ramp(self, channels, direction):
+        """Sets the deadlines of ramps started now on channels and returns their `RampCompletion`. """
+
+        now = time.perf_counter()
+        if type(channels) is int:
+            channels = [channels]
+
+        for channel in channels:
+            if self.states[channel].sweep is not None:
+                self.states[channel].ramp_deadline = now + self.sweep_duration(channel, direction)
+                self.states[channel].ramp_direction = direction
+        self.generation += 1
+
+        return RampCompletion(max([self.states[channel].ramp_deadline for channel in channels]))
+
+    def wait_for_ramp(self, channels):
+        """Blocks until the last ramp started on the selected channel(s) has finished. """
+
+        if type(channels) is int:
+            channels = [channels]
+
+        RampCompletion(max([self.states[channel].ramp_deadline for channel in channels])).wait()
     
+    def abort_ramp(self, channels, ioupdate=True):
+        """Stops running frequency ramps of the selected channel(s) at their current frequency.
+
+        The current frequency is computed from the programmed sweep and the ramp deadline. It is written with `set_output`, which turns off the linear sweep. Channels without a running frequency ramp are not changed.
+
+        ### Returns
+        List of the frequencies at which the ramps were stopped.
+        """
+
+        if type(channels) is int:
+            channels = [channels]
+
+        now = time.perf_counter()
+        stopped = []
+        for channel in channels:
+            state = self.states[channel]
+            sweep = state.sweep
+            if sweep is None or sweep['type'] != 'frequency' or state.ramp_deadline <= now:
+                continue
+
+            duration = self.sweep_duration(channel, state.ramp_direction)
+            done = 1 - (state.ramp_deadline - now)/duration if duration > 0 else 1
+            if state.ramp_direction == 'RU':
+                FTW = sweep['start'] + (sweep['end'] - sweep['start'])*done
+            else:
+                FTW = sweep['end'] - (sweep['end'] - sweep['start'])*done
+            frequency = FTW*self.clock_freq/2**32
+
+            self.set_output(channel, frequency, 'frequency')
+            state.ramp_deadline = 0
+            stopped.append(state.frequency)
+
+        if ioupdate and stopped:
+            self._io_update()
+
+        return stopped
+
     def _toggle_pin(self, pin):
-        gpio.output(pin, 0)
-        gpio.output(pin, 1)
-        gpio.output(pin, 0)
+        pulse = getattr(self.gpio, 'pulse', None)
+        if pulse is not None:
+            pulse(pin)
+            return
+
+        self.gpio.output(pin, 0)
+        self.gpio.output(pin, 1)
+        self.gpio.output(pin, 0)
 
-    def _update(self, var, channels, value):
-        """Updates class internal list of output states. """
+    def _update(self, var, channels, value, data):
+        """Updates the channel states with the requested value and the tuning word contained in data (the bytes written to CFTW0, CPOW0 or ACR). """
 
         if type(channels) is int:
                 channels = [channels]
 
+        self.generation += 1
+
         if var =='frequency':
+            FTW = int.from_bytes(bytes(data), 'big')
             for channel in channels:
-                self.frequencies[channel] = value
+                self.states[channel].frequency = value
+                self.states[channel].FTW = FTW
         elif var =='phase':
+            POW = (data[0] & 0x3F) << 8 | data[1]
             for channel in channels:
-                self.phases[channel] = value
+                self.states[channel].phase = value
+                self.states[channel].POW = POW
         elif var == 'amplitude':
+            ASF = (data[1] & 0x03) << 8 | data[2]
             for channel in channels:
-                self.amplitudes[channel] = value
+                self.states[channel].amplitude = value
+                self.states[channel].ASF = ASF
+
+    def conversion_cache_info(self,):
+        """Returns hit/miss statistics of the frequency, phase and amplitude conversion caches.
+
+        Frequency tuning words are cached per clock frequency and the cache is cleared by `set_freqmult` and `set_refclock`. Phase and amplitude words do not depend on the clock.
+
+        ### Returns
+        dict {'frequency': <CacheInfo>, 'phase': <CacheInfo>, 'amplitude': <CacheInfo>} with hits, misses, maxsize and currsize of each cache.
+        """
+
+        return {'frequency': _frequency_bytes.cache_info(),
+                'phase': _phase_bytes.cache_info(),
+                'amplitude': _amplitude_word.cache_info()}
 
     def _convert_frequency(self, frequency):
         """Convert a frequency to correct spi message. """
 
-        #Assert frequency lies within allowed range
-        FTW_step = self.clock_freq/2**32
-        FTW = round(frequency/FTW_step)
-        Min_freq = 0
-        Max_freq = (2**32-1)*FTW_step
-            
-        assert FTW >= 0, 'Minimum frequency is %r' %Min_freq
-        assert FTW <= 2**32, 'Maximum frequency is %r' %Max_freq
-
-        #Compute frequency tuning word for given frequency and clock frequency
-        #Write FTW in list of 4 bytes (CFTW0 is a 32-bit register)
-        return [FTW.to_bytes(4,'big')[i] for i in range(4)]
+        return list(_frequency_bytes(frequency, self.clock_freq))
 
     def _convert_phase(self, phase):
         """Convert a phase to correct spi message. """
 
-        assert (phase >= 0 and phase < 359.988), 'Phase must be between 0 and 359.987 degrees'
-
-        #Convert phase into POW
-        POW_step = 0.02197265
-        POW = round(phase/POW_step)
-    
-        #Convert POW into bytes
-        BYTE0 = 0x00 | (POW >> 8)
-        BYTE1 = 0xFF & POW
-        return [BYTE0, BYTE1]
+        return list(_phase_bytes(phase))
 
     def _convert_amplitude(self, scale_factor):
         """Convert an amplitude to correct spi message. """
 
-        # acr_state[0] -- amplitude ramp rate. Using default.
+        # acr_state[1][3] -- automatic ramp enable
         # acr_state[1][4] = 0 -- bypassing amp. scale factor (manual mode acr_state[1][4:3] = 10)
         # acr_state[2] -- amplitude scale factor (controls ru/rd time)
 
+        ASF = _amplitude_word(scale_factor) # amplitude scale factor
         acr_state = self._read('ACR')
 
-        assert 0 <= scale_factor <= 1, 'Choose a scale factor in [0,1]'
-
         #if scale_factor == 1: # sets ASF = 0 and disables the multiplier
         #    acr_state[1] &= 0b11101100
         #    acr_state[2] = 0
         #else:   
 
-        ASF = round((2**10-1) * scale_factor) # amplitude scale factor
         acr_state[1] |= 0b00010000 # enable amplitude multiplier
+        acr_state[1] &= 0b11110111 # step to the new scale factor instantly
         acr_state[1] = (acr_state[1] & 0b11111100) + (ASF >> 8)  # write two MSB of scale factor to byte 1
         acr_state[2] = ASF & 0xFF  # write remaining 8 bits of scale factor to byte 2
         
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+"""Command-line batch runner for scripted DDS programs.
+
+# Overview
+Reads a stream of commands from a file or stdin and executes them against the local AD9959 (or the simulated device) or a running server (see `AD9959Http.py`). The input is processed as a generator pipeline (`parse` -> `transactions` -> `run`), so memory use does not depend on the length of the program.
+
+### Input format
+One command per line, either CSV
+```
+<time>,<channel>,<var>,<value>
+```
+or JSON lines
+```
+{"time": <time>, "channel": <channel>, "var": <var>, "value": <value>}
+```
+* `time` -- Time in s after the start of the program at which the command is executed. May be empty (or missing in JSON) to execute the command as soon as possible.
+* `channel` -- Channel number in [0, 1, 2, 3] or several channels separated by `;` (a list in JSON).
+* `var` -- `frequency` (in Hz), `amplitude` (scale factor between 0 and 1) or `phase` (in degree).
+
+Empty lines, lines starting with `#` and a CSV header line starting with `time` are ignored. Consecutive commands with the same time are combined into one transaction, which is written with a single IO update (locally) or one request per variable (server).
+
+### Usage
+```
+python AD9959Batch.py [program] [--server http://<ip>:5000] [--sim] [--no-timing]
+```
+"""
+
+import argparse
+import json
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+
+def parse(lines):
+    """Yields commands (time, channels, var, value) parsed from lines. time is None for commands without time.
+
+    Raises ValueError naming the file (if lines is a file) and line of the first invalid command.
+    """
+
+    name = getattr(lines, 'name', '<input>')
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#') or line.startswith('time'):
+            continue
+
+        try:
+            if line.startswith('{'):
+                command = json.loads(line)
+                t = command.get('time')
+                channels = command['channel']
+                var = command['var']
+                value = command['value']
+            else:
+                t, channels, var, value = [field.strip() for field in line.split(',')]
+                channels = [int(channel) for channel in channels.split(';')]
+
+            if type(channels) is not list:
+                channels = [int(channels)]
+            channels = [int(channel) for channel in channels]
+            if any(channel not in [0, 1, 2, 3] for channel in channels):
+                raise ValueError('channels must be 0, 1, 2 or 3')
+            if var not in ['frequency', 'amplitude', 'phase']:
+                raise ValueError("var must be 'frequency', 'amplitude' or 'phase'")
+            t = float(t) if t not in [None, ''] else None
+            value = float(value)
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError('%s, line %d <%s>: %s' % (name, n, line, e))
+
+        yield t, channels, var, value
+
+
+def transactions(commands):
+    """Yields lists of consecutive commands with the same time. """
+
+    batch = []
+    for command in commands:
+        if batch and (command[0] is None or command[0] != batch[0][0]):
+            yield batch
+            batch = []
+        batch.append(command)
+
+    if batch:
+        yield batch
+
+
+class LocalTarget():
+    """Executes transactions on an AD9959 instance with `AD9959.prepare_output` and `AD9959.set_output_fast`.
+
+    All commands of a transaction are written in one SPI transfer followed by one IO update. The linear sweep is only turned off (which needs a CFR read) for channels with a programmed sweep.
+    """
+
+    def __init__(self, dds):
+        self.dds = dds
+
+    def execute(self, batch):
+        prepared = []
+        for t, channels, var, value in batch:
+            sweeping = any(self.dds.states[channel].sweep is not None for channel in channels)
+            prepared.append(self.dds.prepare_output(channels, value, var, sweep_off=sweeping))
+        self.dds.set_output_fast(prepared, io_update=True)
+
+
+class ServerTarget():
+    """Executes transactions on a running server with one /set_frequency and /set_amplitude request per transaction. """
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def execute(self, batch):
+        requests = {'frequency': {}, 'amplitude': {}}
+        for t, channels, var, value in batch:
+            if var not in requests:
+                raise ValueError('Setting the %s is not supported by the server API.' % var)
+            for channel in channels:
+                requests[var][str(channel)] = repr(value)
+
+        for var, args in requests.items():
+            if args:
+                with urllib.request.urlopen('%s/set_%s?%s' % (self.url, var, urllib.parse.urlencode(args))) as f:
+                    response = json.loads(f.read().decode())
+                if 'error' in response:
+                    raise RuntimeError(response['error'])
+
+
+def run(batches, target, timing=True):
+    """Executes all transactions on target, waiting for their time if timing=True.
+
+    ### Returns
+    (number of commands, number of transactions, duration in s)
+    """
+
+    n_commands = 0
+    n_batches = 0
+    t_start = time.perf_counter()
+
+    for batch in batches:
+        t = batch[0][0]
+        if timing and t is not None:
+            delay = t_start + t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        target.execute(batch)
+        n_commands += len(batch)
+        n_batches += 1
+
+    return n_commands, n_batches, time.perf_counter() - t_start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Execute a DDS program of CSV or JSON line commands.')
+    parser.add_argument('program', nargs='?', default='-', help='program file, - for stdin (default)')
+    parser.add_argument('--server', help='URL of a running AD9959Http server, e.g. http://localhost:5000')
+    parser.add_argument('--sim', action='store_true', help='use the simulated device instead of the hardware')
+    parser.add_argument('--no-timing', action='store_true', help='ignore the time column and run as fast as possible')
+    args = parser.parse_args()
+
+    if args.server:
+        target = ServerTarget(args.server)
+    else:
+        from AD9959 import AD9959
+        if args.sim:
+            from AD9959Sim import open_sim
+            spi, gpio = open_sim()
+            target = LocalTarget(AD9959(spi=spi, gpio=gpio))
+        else:
+            target = LocalTarget(AD9959(warm_start=True))
+
+    program = sys.stdin if args.program == '-' else open(args.program, 'r')
+    with program:
+        n_commands, n_batches, dt = run(transactions(parse(program)), target, timing=not args.no_timing)
+
+    print('Executed %d commands in %d transactions in %.3f s' % (n_commands, n_batches, dt))
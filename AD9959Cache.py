@@ -0,0 +1,136 @@
+"""Content-addressed disk cache of compiled DDS programs.
+
+# Overview
+Compiling large programs (e.g. the point tables of `AD9959.prepare_scan`) into SPI bytes is repeated every time a script or the server restarts. A `ProgramCache` stores the compiled byte images in a directory, one file per program, named by a hash of everything the bytes depend on (the program itself, the clock configuration and `AD9959.__version__`, see `program_key`). Cached images are returned memory-mapped, so they can be handed to the SPI transfer without being read or re-encoded.
+
+The cache is limited to max_bytes and max_entries. When a limit is exceeded, the least recently used images are deleted (the modification time of an image is updated on every hit).
+
+### Usage
+```python
+from AD9959Cache import ProgramCache
+cache = ProgramCache('/var/cache/ad9959', max_bytes=2**28)
+scan = dds.prepare_scan([0, 1], points, cache=cache)
+```
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+
+_SUFFIX = '.bin'
+
+
+def _to_json(value):
+    """json default for numpy values and other objects. """
+
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return repr(value)
+
+
+def program_key(*parts):
+    """Returns the hex digest identifying a program made of parts.
+
+    Numpy arrays and bytes are hashed with their raw contents (and dtype and shape), all other parts as json.
+    """
+
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(('%s%r' % (part.dtype.str, part.shape)).encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        elif isinstance(part, (bytes, bytearray)):
+            digest.update(bytes(part))
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=_to_json).encode())
+        digest.update(b'\0')
+
+    return digest.hexdigest()
+
+
+class ProgramCache():
+    """Directory of compiled byte images addressed by `program_key`. """
+
+    def __init__(self, path=os.path.join(os.path.expanduser('~'), '.cache', 'ad9959'), max_bytes=2**26, max_entries=1024):
+        """Constructor.
+
+        ### Arguments
+        * `path` -- Cache directory. Created if it does not exist.
+        * `max_bytes` -- Maximum total size of all images in bytes.
+        * `max_entries` -- Maximum number of images.
+        """
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + _SUFFIX)
+
+    def get(self, key):
+        """Returns the image stored under key as a read-only memory-mapped uint8 array, None if it is not cached. """
+
+        path = self._file(key)
+        try:
+            os.utime(path)
+            image = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+        except FileNotFoundError:
+            self.stats['misses'] += 1
+            return None
+
+        self.stats['hits'] += 1
+        return image
+
+    def put(self, key, image):
+        """Stores image (uint8 array or bytes) under key and evicts the least recently used images above the limits. """
+
+        path = self._file(key)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(np.ascontiguousarray(image, dtype=np.uint8).tobytes())
+        os.replace(tmp, path)
+
+        self.evict()
+
+    def get_or_compile(self, key, compile):
+        """Returns the image stored under key. On a miss, the image is created with compile(), stored and returned. """
+
+        image = self.get(key)
+        if image is None:
+            image = np.ascontiguousarray(compile(), dtype=np.uint8)
+            self.put(key, image)
+        return image
+
+    def evict(self,):
+        """Deletes the least recently used images until the cache is within max_bytes and max_entries. """
+
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        entries.sort()
+        total = sum(size for mtime, size, name in entries)
+        while entries and (total > self.max_bytes or len(entries) > self.max_entries):
+            mtime, size, name = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.stats['evictions'] += 1
+
+    def clear(self,):
+        """Deletes all images. """
+
+        for name in os.listdir(self.path):
+            if name.endswith(_SUFFIX):
+                os.remove(os.path.join(self.path, name))
@@ -0,0 +1,79 @@
+"""Amplitude flatness calibration for the AD9959.
+
+# Overview
+The output power of the eval board depends on the output frequency (see readme). A `FlatnessCalibration` holds a table of measured output power vs. frequency for each channel and converts it into amplitude scale factor corrections, such that all frequencies are leveled to the lowest measured power of the channel. Pass it to `AD9959.set_calibration` and the corrections are applied automatically whenever a frequency or amplitude is set.
+
+The measured tables are interpolated once onto a dense frequency grid from 0 to half the clock frequency. The interpolated lookup table is cached and only rebuilt when a table or the clock frequency changes.
+
+### Calibration file
+json {<channel number>: [[<frequency in Hz>, <power in dBm>], ...]}. The key "all" sets the same table for all channels.
+"""
+
+import json
+import numpy as np
+
+
+class FlatnessCalibration():
+    """Per-channel power vs. frequency tables and their cached amplitude correction lookup table. """
+
+    def __init__(self, path=None, resolution=10e3):
+        """Constructor.
+
+        ### Arguments
+        * `path` -- Calibration file to load (see module docstring).
+        * `resolution` -- Frequency step in Hz of the interpolated lookup table.
+        """
+
+        self.resolution = resolution
+        self.tables = [None, None, None, None]
+        self._lut = None
+        self._lut_clock_freq = None
+
+        if path is not None:
+            self.load(path)
+
+    def load(self, path):
+        """Loads the tables of a calibration file. """
+
+        with open(path, 'r') as f:
+            tables = json.load(f)
+
+        for channel, table in tables.items():
+            frequencies, powers = zip(*table)
+            channels = range(4) if channel == 'all' else [int(channel)]
+            for ch in channels:
+                self.set_table(ch, frequencies, powers)
+
+    def set_table(self, channel, frequencies, powers):
+        """Sets the measured output power (in dBm) at frequencies (in Hz) of channel. Invalidates the lookup table. """
+
+        assert channel in [0, 1, 2, 3], 'channel must be 0, 1, 2 or 3'
+        assert len(frequencies) == len(powers) and len(frequencies) > 0, 'frequencies and powers must have the same, non-zero length'
+
+        order = np.argsort(frequencies)
+        self.tables[channel] = (np.asarray(frequencies, dtype=float)[order], np.asarray(powers, dtype=float)[order])
+        self._lut = None
+
+    def _build(self, clock_freq):
+        """Interpolates all tables onto the frequency grid and converts them to amplitude corrections. """
+
+        grid = np.arange(0, clock_freq/2 + self.resolution, self.resolution)
+        lut = np.ones((4, len(grid)), dtype=np.float32)
+
+        for channel, table in enumerate(self.tables):
+            if table is None:
+                continue
+            frequencies, powers = table
+            lut[channel] = 10**((powers.min() - np.interp(grid, frequencies, powers))/20)
+
+        self._lut = lut
+        self._lut_clock_freq = clock_freq
+
+    def correction(self, channel, frequency, clock_freq):
+        """Returns the amplitude correction factor (between 0 and 1) of channel at frequency (in Hz). Channels without a table are not corrected. """
+
+        if self._lut is None or self._lut_clock_freq != clock_freq:
+            self._build(clock_freq)
+
+        index = min(int(frequency/self.resolution + 0.5), self._lut.shape[1] - 1)
+        return float(self._lut[channel, index])
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+"""Reference clock output of the RPi for the AD9959.
+
+# Overview
+Programs one of the general purpose clocks (GPCLK0 on gpio4, pin 7, or GPCLK2 on gpio6, pin 31) of the BCM283x directly through its clock manager registers. This is a port of `minimal_clk.c`, which is no longer needed: the clock can be set (and retuned) from python without compiling anything on the RPi.
+
+The output frequency is the frequency of the clock source divided by divI + divF/4096 (integer divider 2-4095, fractional divider 0-4095). The fractional divider is only used with MASH (multi-stage noise shaping) > 0, with MASH = 0 the output is the source divided by divI. `GpClock.set_frequency` returns the exactly achieved (average) frequency, which should be passed to `AD9959.set_refclock`.
+
+The frequencies of the clock sources differ between the SoCs (e.g. PLLD runs at 500 MHz on the BCM2835-7 and at 750 MHz on the BCM2711 of the RPi 4). They are chosen by the SoC named in /proc/device-tree/compatible (see `source_frequencies`) and can be overridden with the `source_freqs` argument.
+
+The clock manager is outside of the range mapped by /dev/gpiomem, so the registers are mapped from /dev/mem, which needs root privileges.
+
+### Usage
+```
+python AD9959Clock.py 50M [--clock 0|2] [--mash 0-3] [--source PLLD|OSC|HDMI|PLLC] [--source-freq <Hz>] [--stop]
+```
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import time
+
+#Clock sources (number in CLK_CTL[3:0], frequency in Hz of the BCM2835-7) in order of preference
+_sources = {
+'PLLD'              :(6, 500e6),
+'OSC'               :(1, 19.2e6),
+'HDMI'              :(7, 216e6),
+'PLLC'              :(5, 1000e6)  # changes with overclock settings
+}
+
+#Source frequencies in Hz of other SoCs (compatible string in the device tree). Sources not listed are not used.
+_soc_source_freqs = {
+'brcm,bcm2711'      :{'PLLD': 750e6, 'OSC': 54e6}
+}
+
+#Offsets of the clock manager and GPIO registers from the peripheral base address
+_CLK_OFFSET = 0x101000
+_GPIO_OFFSET = 0x200000
+_PAGE = 4096
+
+#Register indices (32 bit words) of the clock manager. GPIO pin (BCM) of each clock.
+_CLK_CTL = {0: 28, 2: 32}
+_CLK_DIV = {0: 29, 2: 33}
+_CLK_GPIO = {0: 4, 2: 6}
+
+_PASSWD = 0x5A << 24
+_CTL_BUSY = 1 << 7
+_CTL_KILL = 1 << 5
+_CTL_ENAB = 1 << 4
+
+#GPIO function select ALT0
+_ALT0 = 0b100
+_INPUT = 0b000
+
+
+def _peripheral_base():
+    """Returns the peripheral base address of the SoC. """
+
+    try:
+        with open('/proc/device-tree/soc/ranges', 'rb') as f:
+            ranges = f.read(12)
+        base = struct.unpack('>I', ranges[4:8])[0]
+        if base == 0:
+            # RPi 4 uses 64 bit parent addresses
+            base = struct.unpack('>I', ranges[8:12])[0]
+        return base
+    except OSError:
+        pass
+
+    with open('/proc/cpuinfo', 'r') as f:
+        return 0x20000000 if 'ARMv6' in f.read() else 0x3F000000
+
+
+def source_frequencies():
+    """Returns the frequencies {<source name>: <frequency in Hz>} of the clock sources of the SoC this runs on. """
+
+    try:
+        with open('/proc/device-tree/compatible', 'rb') as f:
+            compatible = f.read().decode(errors='ignore').split('\0')
+    except OSError:
+        compatible = []
+
+    for soc, freqs in _soc_source_freqs.items():
+        if soc in compatible:
+            return dict(freqs)
+    return {name: freq for name, (src, freq) in _sources.items()}
+
+
+def solve_divider(frequency, source_freq):
+    """Returns the (integer, fractional) divider of frequency (in Hz) from a source of source_freq (in Hz), like minimal_clk. """
+
+    div = source_freq/frequency
+    divI = int(div)
+    divF = int((div - divI)*4096)
+
+    return divI, divF
+
+
+def achieved_frequency(source_freq, divI, divF, mash=0):
+    """Returns the (average) output frequency of the dividers divI and divF with MASH. """
+
+    if mash == 0:
+        return source_freq/divI
+    return source_freq/(divI + divF/4096)
+
+
+class GpClock():
+    """General purpose clock of the BCM283x. """
+
+    def __init__(self, clock=0, path='/dev/mem', source_freqs=None):
+        """Constructor. Maps the clock manager and GPIO registers.
+
+        ### Arguments
+        * `clock` -- 0 for GPCLK0 (gpio4) or 2 for GPCLK2 (gpio6).
+        * `path` -- Memory device.
+        * `source_freqs` -- dict {<source name>: <frequency in Hz>} overriding the detected source frequencies (see `source_frequencies`).
+        """
+
+        assert clock in _CLK_CTL, 'clock must be 0 or 2'
+        self.clock = clock
+        self.frequency = None
+        self.source_freqs = source_frequencies()
+        if source_freqs is not None:
+            assert set(source_freqs) <= set(_sources), 'sources must be in %r' % list(_sources)
+            self.source_freqs.update(source_freqs)
+
+        base = _peripheral_base()
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self._clk_map = mmap.mmap(fd, _PAGE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=base + _CLK_OFFSET)
+            self._gpio_map = mmap.mmap(fd, _PAGE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=base + _GPIO_OFFSET)
+        finally:
+            os.close(fd)
+        self._clk = memoryview(self._clk_map).cast('I')
+        self._gpio = memoryview(self._gpio_map).cast('I')
+
+    def set_frequency(self, frequency, source=None, mash=0):
+        """Sets the output frequency (in Hz) and routes the clock to its GPIO pin.
+
+        ### Arguments
+        * `frequency` -- between 4.6875 kHz and 500 MHz.
+        * `source` -- preferred clock source, one of the keys of `_sources`. If the frequency cannot be divided from it, the first usable source is taken.
+        * `mash` -- MASH noise shaping 0-3. Only with MASH > 0 the fractional divider is used.
+
+        ### Returns
+        Achieved output frequency in Hz.
+        """
+
+        assert 4687.5 <= frequency <= 500e6, 'frequency must be between 4.6875 kHz and 500 MHz'
+        assert mash in [0, 1, 2, 3], 'mash must be 0, 1, 2 or 3'
+
+        names = [name for name in _sources if name in self.source_freqs]
+        if source is not None:
+            assert source in names, 'source must be one of %r' % names
+            names.remove(source)
+            names.insert(0, source)
+
+        for name in names:
+            divI, divF = solve_divider(frequency, self.source_freqs[name])
+            if 2 <= divI <= 4095:
+                break
+        else:
+            raise AssertionError('Cannot divide %r Hz from any clock source' % frequency)
+
+        src, source_freq = _sources[name][0], self.source_freqs[name]
+        self._stop_clock()
+        self._clk[_CLK_DIV[self.clock]] = _PASSWD | divI << 12 | divF
+        time.sleep(10e-6)
+        self._clk[_CLK_CTL[self.clock]] = _PASSWD | mash << 9 | src
+        time.sleep(10e-6)
+        self._clk[_CLK_CTL[self.clock]] = _PASSWD | mash << 9 | src | _CTL_ENAB
+
+        self._set_mode(_ALT0)
+        self.frequency = achieved_frequency(source_freq, divI, divF, mash)
+        self.source, self.divI, self.divF, self.mash = name, divI, divF, mash
+
+        return self.frequency
+
+    def stop(self,):
+        """Disables the clock output. """
+
+        self._set_mode(_INPUT)
+        self._stop_clock()
+        self.frequency = None
+
+    def _stop_clock(self,):
+        self._clk[_CLK_CTL[self.clock]] = _PASSWD | _CTL_KILL
+        while self._clk[_CLK_CTL[self.clock]] & _CTL_BUSY:
+            time.sleep(10e-6)
+
+    def _set_mode(self, mode):
+        gpio = _CLK_GPIO[self.clock]
+        register = gpio//10
+        shift = 3*(gpio % 10)
+        self._gpio[register] = self._gpio[register] & ~(0b111 << shift) | mode << shift
+
+
+def start_refclock(frequency=50e6, clock=0, source=None, mash=0, source_freqs=None):
+    """Starts the reference clock output and returns the achieved frequency in Hz (see `GpClock.set_frequency`). """
+
+    return GpClock(clock, source_freqs=source_freqs).set_frequency(frequency, source=source, mash=mash)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Set a general purpose clock output of the RPi.')
+    parser.add_argument('frequency', help='frequency in Hz, optionally with suffix K or M, e.g. 50.0M')
+    parser.add_argument('--clock', type=int, choices=[0, 2], default=0, help='GPCLK0 (gpio4) or GPCLK2 (gpio6)')
+    parser.add_argument('--mash', type=int, choices=[0, 1, 2, 3], default=0)
+    parser.add_argument('--source', choices=list(_sources), default=None, help='preferred clock source')
+    parser.add_argument('--source-freq', type=float, default=None, help='frequency of the source given with --source in Hz, overrides the detected one')
+    parser.add_argument('--stop', action='store_true', help='disable the clock output')
+    args = parser.parse_args()
+
+    if args.source_freq is not None:
+        assert args.source is not None, '--source-freq needs --source'
+    gpclk = GpClock(args.clock, source_freqs={args.source: args.source_freq} if args.source_freq is not None else None)
+    if args.stop:
+        gpclk.stop()
+    else:
+        multiplier = {'K': 1e3, 'M': 1e6}.get(args.frequency[-1].upper(), 1)
+        frequency = float(args.frequency.rstrip('kKmM'))*multiplier
+        f = gpclk.set_frequency(frequency, source=args.source, mash=args.mash)
+        print('Using %s (I=%d F=%d MASH=%d): %.6f MHz' % (gpclk.source, gpclk.divI, gpclk.divF, gpclk.mash, f/1e6))
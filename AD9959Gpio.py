@@ -0,0 +1,114 @@
+"""Register-level GPIO backend for the AD9959.
+
+# Overview
+`GpioMem` implements the parts of the RPi.GPIO interface used by `AD9959` by writing the GPIO registers of the BCM283x directly through `/dev/gpiomem`. All pins of one `output` call are changed with at most two register writes (one to GPSET0 and one to GPCLR0), i.e. simultaneous channel pin changes on several channels are truly simultaneous. `pulse` generates the IO_UPDATE and RESET pulses with two register writes instead of three RPi.GPIO calls.
+
+Use it with `open_hardware(fast_gpio=True)` or `AD9959(fast_gpio=True)`. Only pins 0-31 (all pins of the 40 pin header) are supported.
+"""
+
+import mmap
+import os
+
+#Register offsets in 32 bit words
+_GPFSEL0 = 0x00//4
+_GPSET0 = 0x1C//4
+_GPCLR0 = 0x28//4
+_GPLEV0 = 0x34//4
+
+#40 pin header (BOARD numbering) to BCM GPIO numbers
+_BOARD_TO_BCM = {
+3: 2, 5: 3, 7: 4, 8: 14, 10: 15, 11: 17, 12: 18, 13: 27, 15: 22, 16: 23, 18: 24, 19: 10,
+21: 9, 22: 25, 23: 11, 24: 8, 26: 7, 27: 0, 28: 1, 29: 5, 31: 6, 32: 12, 33: 13, 35: 19,
+36: 16, 37: 26, 38: 20, 40: 21
+}
+
+
+class GpioMem():
+    """RPi.GPIO-like backend using the GPIO set/clear registers of /dev/gpiomem. """
+
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self, path='/dev/gpiomem'):
+        """Constructor. Maps the GPIO registers of path. """
+
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self._map = mmap.mmap(fd, 4096, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self._regs = memoryview(self._map).cast('I')
+        self._mode = self.BOARD
+        self._masks = {}
+
+    def setmode(self, mode):
+        assert mode in [self.BOARD, self.BCM], 'mode must be GpioMem.BOARD or GpioMem.BCM'
+        self._mode = mode
+        self._masks = {}
+
+    def _bcm(self, pin):
+        if self._mode == self.BOARD:
+            assert pin in _BOARD_TO_BCM, 'Pin %r is not a GPIO pin of the 40 pin header' % pin
+            return _BOARD_TO_BCM[pin]
+        assert 0 <= pin < 32, 'Only GPIO 0-31 are supported'
+        return pin
+
+    def _mask(self, pin):
+        mask = self._masks.get(pin)
+        if mask is None:
+            mask = self._masks[pin] = 1 << self._bcm(pin)
+        return mask
+
+    def setup(self, pins, direction, **kwargs):
+        if type(pins) not in (list, tuple):
+            pins = [pins]
+
+        for pin in pins:
+            bcm = self._bcm(pin)
+            register = _GPFSEL0 + bcm//10
+            shift = 3*(bcm % 10)
+            function = 0b001 if direction == self.OUT else 0b000
+            self._regs[register] = self._regs[register] & ~(0b111 << shift) | function << shift
+
+    def output(self, pins, values):
+        """Sets pins to values with one write to GPSET0 and one to GPCLR0. """
+
+        if type(pins) not in (list, tuple):
+            if values:
+                self._regs[_GPSET0] = self._mask(pins)
+            else:
+                self._regs[_GPCLR0] = self._mask(pins)
+            return
+
+        if type(values) not in (list, tuple):
+            values = [values]*len(pins)
+
+        set_mask = 0
+        clear_mask = 0
+        for pin, value in zip(pins, values):
+            if value:
+                set_mask |= self._mask(pin)
+            else:
+                clear_mask |= self._mask(pin)
+
+        if set_mask:
+            self._regs[_GPSET0] = set_mask
+        if clear_mask:
+            self._regs[_GPCLR0] = clear_mask
+
+    def pulse(self, pin):
+        """Generates a high pulse on pin, which has to be low before. """
+
+        mask = self._mask(pin)
+        self._regs[_GPSET0] = mask
+        self._regs[_GPCLR0] = mask
+
+    def input(self, pin):
+        return int(bool(self._regs[_GPLEV0] & self._mask(pin)))
+
+    def cleanup(self, *args):
+        pass
@@ -7,23 +7,36 @@ This script is ment to be run on an RPi connected to an AD9959 eval board. It pr
 
 When changing frequency or amplitude of one channel, the AD9959 will smoothly alter the output. For changing the frequency this transition takes 50 ms per channel. Hence, when updating the freuqncy of all 4 channels at once, it will take 200 ms before all outputs are at the correct frequency.
 
+Local processes on the RPi can bypass HTTP: the channel states are published in the shared-memory segment `/dev/shm/ad9959`, which also accepts commands (see `AD9959Shm.py`).
+
+All updates are executed by a single worker thread in the order of their priority class (see `Scheduler`). API calls default to the class `experiment`, the web interface uses the lower class `ui`, whose running ramps are preempted by experiment updates. Updates of the same channel and variable arriving in quick succession are collapsed to the newest value and a running frequency ramp is aborted when a newer frequency for that channel arrives.
+
 # Web interface
 The website is hosted by default on port 5000 on the RPi. Use the buttons next to each channel to update the settings to the values input to the text boxes. The website can be modified by changing `static/webinterface_settings.json`. (Not implemented yet!)
 
 # Flask based API functions
 There are functions for setting frequency and amplitude of all for channels as well as for resetting the outputs
 * `/set_frequency` -- Smootly ramps the freuqncy of the specified channels to a new value. Takes 50 ms per channel.
-* `/set_amplitude` -- Smootly ramps the amplitude of the specified channels. Uses the built-in transition timing.
+* `/set_amplitude` -- Smootly ramps the amplitude of the specified channels. The ramp takes 2 ms per channel.
 * `/reset` -- Resets all outputs to zero output.
+* `/scheduler` -- Statistics of the update scheduler per priority class.
+* `/presets` -- Lists the names of the stored presets.
+* `/save_preset` -- Stores the register image of all channels as a named preset.
+* `/recall_preset` -- Restores a named preset with a single SPI burst and one IO update.
+* `/profile_start`, `/profile_stop`, `/profile` -- Samples the stacks of the running server for a bounded time window and returns them as flame graph input.
 * `/shutdown` -- Closes the server. You will have to manually restart it.
 * `/doc` -- Shows the documentation for all API functions.
 
+The responses of `/`, `/outputs`, `/presets` and `/doc` are cached until the DDS state or the settings change and carry an ETag. Clients polling with an `If-None-Match` header get `304 Not Modified` while nothing has changed.
+
 ### Starting the server
 For starting the server use (export instead of set in linux)
 set FLASK_APP=<filename>
 (set FLASK_DEBUG=True)
 python -m flask run.
 
+Set the environment variable `AD9959_SIM=1` to run the server against the simulated device of `AD9959Sim.py` instead of the hardware, e.g. for load tests (see `AD9959Load.py`). The reference clock is then not started and the shared-memory segment is `/dev/shm/ad9959-sim`.
+
 ### Notes
 Make sure that flask and flask_autodoc are installed. Then replace `add_custom_nl2br_filters(self, app)` in 
 `<python-installation>\Lib\site-packages\flask_autodoc\autrodoc.py` by
@@ -42,24 +55,43 @@ Make sure that flask and flask_autodoc are installed. Then replace `add_custom_n
 Also import make sure `escape` and `Markup` are imported from `jinja2`
 
 ### Known bugs
-* Frequency ramps are set by programming the lower and upper frequency in two registers and the direction is then set by the state of the data pin (P0-P3) corresponding to that channel (pin high: ramp up, pin low: ramp down). This works correctly when starting with a ramp up but does not when you want to start with a ramp down. In order to get the ramp down to work, pull the data pin high, then program the ramp with the shortest possible transition time (1 us) and immedialely after program the ramp again with the correct transition time. After that pull the data pin low and the ramp will be done correctly. See `AD9959Http.set_frequency` for reference.
+* Frequency ramps are set by programming the lower and upper frequency in two registers and the direction is then set by the state of the data pin (P0-P3) corresponding to that channel (pin high: ramp up, pin low: ramp down). This works correctly when starting with a ramp up but does not when you want to start with a ramp down, because the channel first has to reach the upper frequency. `AD9959.program_ramp` handles this by completing a single-step rising ramp before writing the real rising delta word. See `AD9959Http.set_frequency` for reference.
 * When changing the frequency at an amplitude scale factor < 1, the current divider setting (register 'CFR') will be overridden by 0. This means that the amplitude will be scaled by an additional factor of 1/8. This bug is also descirbed in `AD9959.py` and is fixed by resetting the current divider setting back to one. See `AD9959.py` documentation for details. 
 """
 
 import flask
 from flask_autodoc import Autodoc
 from AD9959 import AD9959
+from AD9959Calibration import FlatnessCalibration
+from AD9959Clock import start_refclock
+from AD9959Profile import SamplingProfiler
+from AD9959Shm import ShmServer
+from AD9959Sim import open_sim
+import collections
 import json
+import math
+import os
 import time
-import subprocess
+import threading
 
-# enable clock output
-subprocess.call(['/usr/bin/minimal_clk', '50.0M', '-q'])
+# Run against the simulated device instead of the hardware (e.g. for AD9959Load.py).
+simulated = bool(os.environ.get('AD9959_SIM'))
 
 app = flask.Flask(__name__)
 auto = Autodoc(app)
 
-DDS = AD9959()
+if simulated:
+    refclock_freq = 50e6
+    spi, gpio = open_sim()
+    DDS = AD9959(spi=spi, gpio=gpio)
+else:
+    # enable clock output
+    refclock_freq = start_refclock(50e6)
+    DDS = AD9959()
+DDS.set_refclock(refclock_freq)
+
+# Serializes access to the DDS between the update worker (see Scheduler) and the request threads.
+dds_lock = threading.RLock()
 
 try:
     with open('static/webinterface_settings.json', 'r') as f:
@@ -74,7 +106,54 @@ except FileNotFoundError:
     with open('static/webinterface_settings.json', 'w') as f:
         json.dump(web_settings, f)
 
+# Named presets of the register image of all channels. The SPI burst of each preset is compiled once when loaded or saved.
+try:
+    with open('static/presets.json', 'r') as f:
+        presets = json.load(f)
+except FileNotFoundError:
+    presets = {}
+
+preset_bursts = {name: DDS.compile_image(image) for name, image in presets.items()}
+
+# Amplitude flatness calibration (see AD9959Calibration.py), applied when the file exists.
+try:
+    DDS.set_calibration(FlatnessCalibration('static/calibration.json'))
+except FileNotFoundError:
+    pass
+
+# Incremented whenever settings shown by the server (e.g. presets) change. See cached_response.
+settings_generation = 0
+response_cache = {}
+# Distinguishes ETags of different server runs, whose generation counters start again at 0.
+server_run = '%x' % int(time.time())
+
 """ ~~~Internal function~~~ """
+def cached_response(key, render, versioned=True):
+    """Returns the cached response of key, rendering it with render() only when the state has changed.
+
+    # Function description
+    Responses are versioned by `DDS.generation` and `settings_generation` (unless versioned=False) and sent with the version as ETag. Requests with a matching If-None-Match header are answered with 304 Not Modified.
+
+    ### Arguments
+    * `key` -- Name of the cached response, e.g. the route.
+    * `render` -- Function returning the response body.
+    """
+
+    version = '%s-%s-%d-%d' % (key, server_run, DDS.generation, settings_generation) if versioned else key + '-' + server_run
+    if version in flask.request.if_none_match:
+        response = flask.Response(status=304)
+        response.set_etag(version)
+        return response
+
+    entry = response_cache.get(key)
+    if entry is None or entry[0] != version:
+        entry = (version, render())
+        response_cache[key] = entry
+
+    response = flask.Response(entry[1])
+    response.set_etag(version)
+    return response
+
 def get_dds_state():
     """ Gets frequency,amplitude and phase of each channel. """
 
@@ -84,16 +163,19 @@ def get_dds_state():
                          'phase': DDS.phases[i], 'amplitude': DDS.amplitudes[i] * 100})
     return channels
     
-def set_frequency(channel, frequency):
+def set_frequency(channel, frequency, abort=None):
     """Smooth transition of the frequency output of one channel to a new value.
     
     # Function description
-    Reads the current frequency of one channel from the DDS and then ramps to the new frequency withing 50 ms. After the ramp the frequency is set to the new value. When the current output frequency is 0, the new freuqncy is set immediately. A ramp between the two frequencies is only performed when they differ by more than 1 MHz.
+    Reads the current frequency of one channel from the DDS and then ramps to the new frequency withing 50 ms using `AD9959.ramp_frequency`. The function returns as soon as the ramp has finished, the channel then rests at the new frequency. When the current output frequency is 0, the new freuqncy is set immediately. A ramp between the two frequencies is only performed when they differ by more than 1 MHz.
 
     ### Arguments
     * `channel` -- Channel number in [0, 1, 2, 3].
     * `frequency` -- New frequency output in Hz.
 
+    ### Keyword arguments
+    * `abort` -- threading.Event. When it is set during the ramp, the ramp is stopped at the current frequency (see `AD9959.abort_ramp`).
+
     ### Returns
     False when channel was set correctly, otherwise error message.
     """
@@ -112,27 +194,20 @@ def set_frequency(channel, frequency):
     f0 = DDS.frequencies[channel]
     
     if f0 > 0 and abs(f1 - f0) > 1e6:
-        if f0 < f1:
-            try:
-                DDS.set_ramp_direction(channels=channel, direction='RD')
-                DDS.set_freqsweeptime(channels=channel, start_freq=f0, end_freq=f1, sweeptime=dt, no_dwell=False, ioupdate=True, trigger=False)
-                DDS.set_ramp_direction(channels=channel, direction='RU')
-            except AssertionError as ae:
-                return 'Error in AD9959.set_frequency ramp up. Message: ' + ae.args[0]
-        else:
-            try:
-                DDS.set_ramp_direction(channels=channel, direction='RU')
-                DDS.set_freqsweeptime(channels=channel, start_freq=f1, end_freq=f0, sweeptime=1e-6, no_dwell=False, ioupdate=True, trigger=False)
-                DDS.set_freqsweeptime(channels=channel, start_freq=f1, end_freq=f0, sweeptime=dt, no_dwell=False, ioupdate=True, trigger=False)
-                DDS.set_ramp_direction(channels=channel, direction='RD')
-            except AssertionError as ae:
-                return 'Error in AD9959.set_frequency ramp down. Message: ' + ae.args[0]
-        time.sleep(dt)
+        try:
+            completion = DDS.ramp_frequency(channels=channel, frequency=f1, sweeptime=dt)
+        except AssertionError as ae:
+            return 'Error in AD9959.set_frequency ramp. Message: ' + ae.args[0]
 
-    try:
-        DDS.set_output(channels=channel, value=f1, var='frequency', io_update=True)
-    except AssertionError as ae:
-        return 'Error in AD9959.set_frequency. Message: ' + ae.args[0]
+        if abort is not None and abort.wait(completion.remaining()):
+            DDS.abort_ramp(channel)
+        else:
+            completion.wait()
+    else:
+        try:
+            DDS.set_output(channels=channel, value=f1, var='frequency', io_update=True)
+        except AssertionError as ae:
+            return 'Error in AD9959.set_frequency. Message: ' + ae.args[0]
 
     return False
 
@@ -143,10 +218,14 @@ def set_amplitude(channel, amplitude):
     * `channel` -- Channel number in [0, 1, 2, 3].
     * `amplitude` -- Scaling factor for new amplitude between 0 and 1
 
+    The amplitude is ramped in steps within 2 ms (see `AD9959.set_output`), the function returns when the new amplitude is set.
+
     ### Returns
     False when new amplitude was set, Error message otherwise.
     """
 
+    dt = 2e-3 # ramp time.
+
     try:
         channel = int(channel)
     except ValueError:
@@ -157,7 +236,7 @@ def set_amplitude(channel, amplitude):
         return 'Cannot convert <' + str(amplitude) + '> to float.'
 
     try:
-        DDS.set_output(channels=channel, value=amplitude, var='amplitude', io_update=True)
+        DDS.set_output(channels=channel, value=amplitude, var='amplitude', io_update=True, ramp_time=dt)
     except AssertionError as ae:
         return 'Error in set_amplitude. Message: ' + ae.args[0]
 
@@ -190,14 +269,222 @@ def set_phase(channel, phase):
 
     return False
 
+def validate_update(channel, value):
+    """Checks an update before it is submitted to the scheduler.
+
+    ### Returns
+    False when channel is in [0, 1, 2, 3] and value is a finite number, otherwise error message.
+    """
+
+    try:
+        channel = int(channel)
+    except ValueError:
+        return 'Cannot convert <' + str(channel) + '> to int.'
+    if channel not in [0, 1, 2, 3]:
+        return 'Channel <' + str(channel) + '> must be 0, 1, 2 or 3.'
+    try:
+        value = float(value)
+    except ValueError:
+        return 'Cannot convert <' + str(value) + '> to float.'
+    if not math.isfinite(value):
+        return 'Value <' + str(value) + '> is not a finite number.'
+
+    return False
+
+class Scheduler():
+    """Executes output updates in a worker thread in the order of their priority class and collapses rapid-fire updates to the newest value.
+
+    # Function description
+    Every update is submitted with a priority class. The worker always executes the oldest pending update of the highest priority class, after it has waited for the collection window of its class. If several updates for the same channel and variable are pending, only the newest value is executed (in the higher of their classes) and all submitters receive its result.
+    A new frequency for a channel whose ramp is currently running aborts that ramp. An update of a higher class preempts a running frequency ramp of a lower class: the ramp is aborted and the update is queued again to be finished after the higher class updates.
+    Each class has a limit of waiting submitters, further updates are rejected (updates submitted together with `submit_all` are queued or rejected as a whole). The time submitters wait until their update is started is recorded per class (see `stats`).
+
+    ### Arguments
+    * `classes` -- list of (name, collection window in s, queue limit) in order of decreasing priority.
+    """
+
+    def __init__(self, classes=[('experiment', 0, 64), ('ui', 5e-3, 16)]):
+        self.classes = [name for name, window, limit in classes]
+        self.windows = {name: window for name, window, limit in classes}
+        self.limits = {name: limit for name, window, limit in classes}
+        self.setters = {'frequency': set_frequency, 'amplitude': set_amplitude, 'phase': set_phase}
+        self.cond = threading.Condition()
+        self.pending = {name: {} for name in self.classes}
+        self.waiting = {name: 0 for name in self.classes}
+        self.submitted = {}
+        self.results = {}
+        self.ticket = 0
+        self.active = None
+        self.active_class = None
+        self.preempted = False
+        self.abort = threading.Event()
+        self.counts = {name: {'submitted': 0, 'rejected': 0, 'executed': 0, 'aborted': 0, 'preempted': 0} for name in self.classes}
+        self.waits = {name: collections.deque(maxlen=1000) for name in self.classes}
+
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, channel, var, value, priority='experiment'):
+        """Queues an update of var ('frequency', 'amplitude' or 'phase') of channel with a priority class.
+
+        ### Returns
+        Ticket for `result`, None if the queue of the priority class is full.
+        """
+
+        tickets = self.submit_all([(channel, var, value)], priority=priority)
+        return tickets[0] if tickets is not None else None
+
+    def submit_all(self, updates, priority='experiment'):
+        """Queues a list of updates (channel, var, value) with a priority class, either all of them or none.
+
+        ### Returns
+        List of tickets for `result` in the order of updates, None if the queue of the priority class has no room for all of them.
+        """
+
+        assert priority in self.classes, 'priority must be one of %r' % self.classes
+
+        with self.cond:
+            if self.waiting[priority] + len(updates) > self.limits[priority]:
+                self.counts[priority]['rejected'] += len(updates)
+                return None
+
+            tickets = [self._queue(str(channel), var, value, priority) for channel, var, value in updates]
+            self.cond.notify_all()
+            return tickets
+
+    def result(self, ticket):
+        """Blocks until the update of ticket (or a newer value superseding it) was executed. Returns False or an error message. """
+
+        with self.cond:
+            while ticket not in self.results:
+                self.cond.wait()
+            return self.results.pop(ticket)
+
+    def results_all(self, tickets):
+        """Waits for the `result` of every ticket, so none of them is left in self.results. Returns the first error message or False. """
+
+        errors = [self.result(ticket) for ticket in tickets]
+        return next((err for err in errors if err), False)
+
+    def _queue(self, channel, var, value, priority):
+        """Queues one update, self.cond must be held. Returns its ticket. """
+
+        key = (channel, var)
+        self.ticket += 1
+        now = time.perf_counter()
+        value_tickets = [self.ticket]
+        since = now
+        for name in self.classes:
+            if key in self.pending[name]:
+                old_value, old_tickets, old_since = self.pending[name].pop(key)
+                value_tickets = old_tickets + value_tickets
+                since = min(since, old_since)
+                if self.classes.index(name) < self.classes.index(priority):
+                    priority = name
+        self.pending[priority][key] = [value, value_tickets, since]
+        self.submitted[self.ticket] = (priority, now)
+        self.waiting[priority] += 1
+        self.counts[priority]['submitted'] += 1
+
+        if self.active is not None and self.active[1] == 'frequency':
+            if key == self.active and var == 'frequency':
+                self.abort.set()
+            elif self.classes.index(priority) < self.classes.index(self.active_class):
+                self.preempted = True
+                self.abort.set()
+
+        return self.ticket
+
+    def stats(self,):
+        """Returns the counters and the wait times (until the update is started, in s) of the last 1000 submitters of each priority class.
+
+        ### Returns
+        dict {<class>: {'submitted', 'rejected', 'executed', 'aborted', 'preempted', 'waiting', 'wait_p50', 'wait_p99', 'wait_max'}}
+        """
+
+        with self.cond:
+            stats = {}
+            for name in self.classes:
+                waits = sorted(self.waits[name])
+                stats[name] = dict(self.counts[name], waiting=self.waiting[name])
+                for label, q in [('wait_p50', 0.5), ('wait_p99', 0.99)]:
+                    stats[name][label] = waits[min(int(q*len(waits)), len(waits) - 1)] if waits else None
+                stats[name]['wait_max'] = waits[-1] if waits else None
+            return stats
+
+    def _next(self,):
+        """Returns (class, key) of the next update to execute or the time in s until one is due (None if nothing is pending). """
+
+        now = time.perf_counter()
+        for name in self.classes:
+            if self.pending[name]:
+                key, (value, tickets, since) = next(iter(self.pending[name].items()))
+                due = since + self.windows[name] - now
+                return (name, key) if due <= 0 else due
+        return None
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    next_update = self._next()
+                    if type(next_update) is tuple:
+                        break
+                    self.cond.wait(next_update)
+
+                priority, key = next_update
+                value, tickets, since = self.pending[priority].pop(key)
+                now = time.perf_counter()
+                for ticket in tickets:
+                    if ticket in self.submitted:
+                        name, t = self.submitted.pop(ticket)
+                        self.waits[name].append(now - t)
+                        self.waiting[name] -= 1
+                self.active = key
+                self.active_class = priority
+                self.preempted = False
+                self.abort.clear()
+
+            channel, var = key
+            try:
+                with dds_lock:
+                    if var == 'frequency':
+                        err = set_frequency(channel, value, abort=self.abort)
+                    else:
+                        err = self.setters[var](channel, value)
+            except Exception as e:
+                # keep the worker alive, the submitters get the error
+                err = 'Error in %s update of channel %s. Message: %r' % (var, channel, e)
+
+            with self.cond:
+                self.active = None
+                if self.preempted and not err and not any(key in self.pending[name] for name in self.classes):
+                    # finish the preempted ramp after the higher class updates
+                    self.counts[priority]['preempted'] += 1
+                    self.pending[priority][key] = [value, tickets, since]
+                else:
+                    self.counts[priority]['executed'] += 1
+                    if self.abort.is_set():
+                        self.counts[priority]['aborted'] += 1
+                    for ticket in tickets:
+                        self.results[ticket] = err
+                self.cond.notify_all()
+
+scheduler = Scheduler()
+
+# Local processes read the channel states and send commands through shared memory instead of HTTP (see AD9959Shm.py).
+shm = ShmServer(DDS, path='/dev/shm/ad9959-sim' if simulated else '/dev/shm/ad9959', lock=dds_lock)
+shm.start()
+
+# Sampling profiler of the server process, only runs while started with /profile_start (see AD9959Profile.py).
+profiler = SamplingProfiler()
+
 """ ~~~Functions soley used for operating the web page~~~ """
 
 @app.route('/')
 def index():
     """Generate the web interface from template file with current DDS settings. """
 
-    channels = get_dds_state()
-    return flask.render_template('dds.html', channels=channels, settings=web_settings)
+    return cached_response('index', lambda: flask.render_template('dds.html', channels=get_dds_state(), settings=web_settings))
 
 @app.route('/set_apf/<int:channel>', methods=['POST', 'GET'])
 def set_APF(channel):
@@ -221,10 +508,15 @@ def set_APF(channel):
     amplitude = float(r['amplitude_' + str(channel)])
     phase = float(r['phase_' + str(channel)])
     frequency = float(r['frequency_' + str(channel)])
-
-    set_frequency(channel, frequency*1e6)
-    set_amplitude(channel, amplitude/100)
-    set_phase(channel, phase)
+    for value in [amplitude, phase, frequency]:
+        if validate_update(channel, value):
+            return flask.redirect(flask.url_for('index'))
+
+    tickets = scheduler.submit_all([(channel, 'frequency', frequency*1e6),
+                                    (channel, 'amplitude', amplitude/100),
+                                    (channel, 'phase', phase)], priority='ui')
+    if tickets is not None:
+        scheduler.results_all(tickets)
     
     return flask.redirect(flask.url_for('index'))
 
@@ -233,7 +525,8 @@ def set_APF(channel):
 def reset_DDS():
     """Resets all DDS channels to 0 output. """
 
-    DDS.init_dds()
+    with dds_lock:
+        DDS.init_dds()
     return flask.redirect(flask.url_for('index'))
 
 """ ~~~API functions~~~ """
@@ -252,12 +545,14 @@ def get_outputs():
     * `displayed name` -- The name of the channel displayed in the web interface.
     """
     
-    channels = get_dds_state()
-    resp = {}
-    for item in channels:
-        resp[item['id']] = {'frequency': item['frequency'] * 1e6, 'amplitude': item['amplitude'], 'phase': item['phase'], 'name': web_settings['channel names'][item['id']]}
-    
-    return json.dumps(resp)
+    def render():
+        channels = get_dds_state()
+        resp = {}
+        for item in channels:
+            resp[item['id']] = {'frequency': item['frequency'] * 1e6, 'amplitude': item['amplitude'], 'phase': item['phase'], 'name': web_settings['channel names'][item['id']]}
+        return json.dumps(resp)
+
+    return cached_response('outputs', render)
     
 @app.route('/set_frequency', methods=['POST', 'GET'])
 @auto.doc('public')
@@ -271,17 +566,29 @@ def set_frequency_output():
     * `input_data` -- dict {<channel number>: <frequency>}
                             <channel number> must be 0, 1, 2, or 3
                             <frequency> must be a valid frequency in Hz.
+    * `priority` -- Priority class (see `/scheduler`), default `experiment`.
+
     ### Returns
     State of all DDS channels.
     """
 
     input_data = flask.request.args.to_dict()
+    priority = input_data.pop('priority', 'experiment')
+    if priority not in scheduler.classes:
+        return json.dumps({'error': 'Unknown priority class <' + priority + '>.'})
 
     for channel, frequency in input_data.items():
-        err = set_frequency(channel, frequency)
+        err = validate_update(channel, frequency)
         if err:
             return json.dumps({'error': err})
 
+    tickets = scheduler.submit_all([(channel, 'frequency', frequency) for channel, frequency in input_data.items()], priority=priority)
+    if tickets is None:
+        return json.dumps({'error': 'Queue of priority class <' + priority + '> is full.'})
+    err = scheduler.results_all(tickets)
+    if err:
+        return json.dumps({'error': err})
+
     return get_outputs()
 
 @app.route('/set_amplitude', methods=['POST', 'GET'])
@@ -296,20 +603,175 @@ def set_amplitude_output():
     * `input_data` -- dict {<channel number>: <amplitude>}
                             <channel number> must be 0, 1, 2, or 3
                             <amplitude> must be between 0.001 and 1
+    * `priority` -- Priority class (see `/scheduler`), default `experiment`.
 
     ### Returns
     State of all DDS channels.
     """
 
     input_data = flask.request.args.to_dict()
+    priority = input_data.pop('priority', 'experiment')
+    if priority not in scheduler.classes:
+        return json.dumps({'error': 'Unknown priority class <' + priority + '>.'})
 
     for channel, amplitude in input_data.items():
-        err = set_amplitude(channel, amplitude)
+        err = validate_update(channel, amplitude)
         if err:
             return json.dumps({'error': err})
 
+    tickets = scheduler.submit_all([(channel, 'amplitude', amplitude) for channel, amplitude in input_data.items()], priority=priority)
+    if tickets is None:
+        return json.dumps({'error': 'Queue of priority class <' + priority + '> is full.'})
+    err = scheduler.results_all(tickets)
+    if err:
+        return json.dumps({'error': err})
+
+    return get_outputs()
+
+@app.route('/scheduler')
+@auto.doc('public')
+def get_scheduler():
+    """Returns the statistics of the update scheduler.
+
+    # Function description
+    Updates are executed in the order of their priority class (`experiment` before `ui`). For each class the number of submitted, rejected (queue full), executed, aborted and preempted updates, the number of waiting submitters and the time (in s) the last 1000 submitters waited until their update was started are reported.
+
+    ### Returns
+    json({<class>: {'submitted', 'rejected', 'executed', 'aborted', 'preempted', 'waiting', 'wait_p50', 'wait_p99', 'wait_max'}})
+    """
+
+    return json.dumps(scheduler.stats())
+
+@app.route('/presets')
+@auto.doc('public')
+def list_presets():
+    """Returns the names of all stored presets.
+
+    ### Returns
+    json([<preset name>, ...])
+    """
+
+    return cached_response('presets', lambda: json.dumps(sorted(presets)))
+
+@app.route('/save_preset', methods=['POST', 'GET'])
+@auto.doc('public')
+def save_preset():
+    """Stores the current settings of all channels as a named preset.
+
+    # Function description
+    Reads the register image of all 4 channels and saves it to `static/presets.json`. An existing preset with the same name is overwritten.
+
+    ### Arguments
+    * `name` -- Name of the preset.
+
+    ### Returns
+    Names of all stored presets.
+    """
+
+    name = flask.request.args.get('name')
+    if not name:
+        return json.dumps({'error': 'No preset name given.'})
+
+    global settings_generation
+
+    with dds_lock:
+        presets[name] = DDS.get_image()
+        preset_bursts[name] = DDS.compile_image(presets[name])
+        settings_generation += 1
+
+        # concurrent saves must not interleave or truncate the file
+        with open('static/presets.json.tmp', 'w') as f:
+            json.dump(presets, f)
+        os.replace('static/presets.json.tmp', 'static/presets.json')
+
+    return list_presets()
+
+@app.route('/recall_preset', methods=['POST', 'GET'])
+@auto.doc('public')
+def recall_preset():
+    """Restores a named preset.
+
+    # Function description
+    All registers of the preset are written to the DDS in a single precompiled SPI burst followed by one IO update. The outputs change without a ramp.
+
+    ### Arguments
+    * `name` -- Name of the preset.
+
+    ### Returns
+    State of all DDS channels.
+    """
+
+    name = flask.request.args.get('name')
+    if name not in presets:
+        return json.dumps({'error': 'Unknown preset <' + str(name) + '>.'})
+
+    with dds_lock:
+        DDS.load_image(presets[name], burst=preset_bursts[name])
+
     return get_outputs()
 
+@app.route('/profile_start', methods=['POST', 'GET'])
+@auto.doc('public')
+def profile_start():
+    """Starts the sampling profiler of the server.
+
+    # Function description
+    Samples the stacks of all threads of the server for a bounded time window, e.g. to find out why the server is slow without restarting it. The previous profile is discarded. Get the result with `/profile`. When no profile is running, the profiler does not slow the server down.
+
+    ### Arguments
+    * `duration` -- Length of the window in s, at most 60 (default 10).
+    * `interval` -- Time between two samples in s (default 0.005).
+
+    ### Returns
+    Status of the profiler (see `/profile_stop`).
+    """
+
+    try:
+        duration = float(flask.request.args.get('duration', 10))
+        interval = float(flask.request.args.get('interval', 5e-3))
+        profiler.start(duration=duration, interval=interval)
+    except ValueError:
+        return json.dumps({'error': 'duration and interval must be numbers.'})
+    except AssertionError as ae:
+        return json.dumps({'error': ae.args[0]})
+
+    return json.dumps(profiler.status())
+
+@app.route('/profile_stop', methods=['POST', 'GET'])
+@auto.doc('public')
+def profile_stop():
+    """Stops the sampling profiler before the end of its window.
+
+    ### Returns
+    json({'running', 'started', 'stopped', 'interval', 'samples', 'stacks', 'driver_samples'}) with the following variables
+    * `started`, `stopped` -- Start and end of the window (unix time).
+    * `samples` -- Number of samples taken.
+    * `stacks` -- Number of distinct stacks.
+    * `driver_samples` -- Number of stacks sampled in a driver call (`set_output`, `_write`, `_read`, `_toggle_pin`).
+    """
+
+    profiler.stop()
+    return json.dumps(profiler.status())
+
+@app.route('/profile')
+@auto.doc('public')
+def get_profile():
+    """Returns the collapsed stacks of the last profile.
+
+    # Function description
+    Each line is `<thread>;<frame>;...;<frame> <count>`, which can be rendered with flamegraph.pl or speedscope. Frames of driver calls are labeled with `[driver]`. While the profiler is running, the stacks sampled so far are returned.
+
+    ### Returns
+    Text file `ad9959-<start time>.folded`.
+    """
+
+    if profiler.started is None:
+        return json.dumps({'error': 'No profile recorded, start one with /profile_start.'})
+
+    response = flask.Response(profiler.collapsed(), mimetype='text/plain')
+    response.headers['Content-Disposition'] = 'attachment; filename=ad9959-%s.folded' % time.strftime('%Y%m%d-%H%M%S', time.localtime(profiler.started))
+    return response
+
 @app.route('/shutdown', methods=['POST', 'GET'])
 @auto.doc('public')
 def shutdown():
@@ -325,7 +787,7 @@ def shutdown():
 def documentation():
     """Shows the documentation rendered by autodoc. """
 
-    return auto.html('public', title='AD9959 (DDS) doc')
+    return cached_response('doc', lambda: auto.html('public', title='AD9959 (DDS) doc'), versioned=False)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(web_settings['port']))
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+
+"""Command journal for the AD9959 with record and replay.
+
+# Overview
+When enabled with `AD9959.enable_journal`, every public call of the `AD9959` instance as well as all resulting SPI frames and GPIO edges are appended to a compact binary journal. The journal is written through a memory map into preallocated segment files `<path>.0000`, `<path>.0001`, ... . When a segment is full, the journal rotates to the next one and only the newest `max_segments` segments are kept.
+
+### Record format
+Each segment starts with `MAGIC`. Records are a header `<BdI` (kind, time in s since the journal was opened, payload length) followed by the payload. A record of kind 0 marks the end of a segment.
+* `CALL` -- json [<method name>, <args>, <kwargs>]. Numpy arrays, `PreparedOutput`, `PreparedScan` and `FlatnessCalibration` arguments are stored with all their contents (see `_to_json`), so they are rebuilt exactly on replay.
+* `SPI_WRITE` -- bytes written with writebytes/writebytes2
+* `SPI_XFER` -- bytes sent with xfer2
+* `SPI_READ` -- number of bytes read with readbytes (uint32)
+* `GPIO` -- pairs of (pin, level) bytes
+
+### Replay
+```
+python AD9959Journal.py <path> [--target sim|hardware] [--speed original|max] [--level frames|calls]
+```
+Replays the journal against the simulated device (see `AD9959Sim.py`) or the real hardware, either with the original timing or as fast as possible. `--level frames` re-issues the recorded SPI frames and GPIO edges, `--level calls` re-issues the recorded public calls on a new `AD9959` instance. Calls with arguments that cannot be stored are skipped with a warning, they are only replayed at frame level.
+"""
+
+import argparse
+import glob
+import json
+import mmap
+import os
+import struct
+import time
+from warnings import warn
+import numpy as np
+
+MAGIC = b'AD9959J1'
+
+END = 0
+CALL = 1
+SPI_WRITE = 2
+SPI_XFER = 3
+SPI_READ = 4
+GPIO = 5
+
+_header = struct.Struct('<BdI')
+
+
+def _segment_path(path, index):
+    return '%s.%04d' % (path, index)
+
+
+def _to_json(value):
+    """json default for numpy values and the prepared objects of the AD9959. Other objects are stored as {'__repr__': repr(value)}. """
+
+    if isinstance(value, np.ndarray):
+        return {'__ndarray__': value.tolist(), 'dtype': value.dtype.str}
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+
+    name = type(value).__name__
+    if name in ['PreparedOutput', 'PreparedScan']:
+        return {'__object__': name, 'attributes': {slot: getattr(value, slot) for slot in type(value).__slots__}}
+    if name == 'FlatnessCalibration':
+        return {'__object__': name, 'attributes': {'resolution': value.resolution, 'tables': value.tables}}
+    return {'__repr__': repr(value)}
+
+
+class Unreplayable(Exception):
+    """Raised when decoding an argument that was stored as its repr. """
+
+
+def _from_json(value):
+    """json object_hook inverting `_to_json`. """
+
+    if '__ndarray__' in value:
+        return np.array(value['__ndarray__'], dtype=value['dtype'])
+    if '__repr__' in value:
+        raise Unreplayable(value['__repr__'])
+    if '__object__' not in value:
+        return value
+
+    name, attributes = value['__object__'], value['attributes']
+    if name == 'FlatnessCalibration':
+        from AD9959Calibration import FlatnessCalibration
+        calibration = FlatnessCalibration(resolution=attributes['resolution'])
+        for channel, table in enumerate(attributes['tables']):
+            if table is not None:
+                calibration.set_table(channel, *table)
+        return calibration
+
+    import AD9959
+    return getattr(AD9959, name)(**attributes)
+
+
+class Journal():
+    """Append-only, memory-mapped journal with rotation. """
+
+    def __init__(self, path, segment_size=2**24, max_segments=8):
+        """Constructor. Opens a new segment after the last existing segment of path. """
+
+        self.path = path
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.t0 = time.monotonic()
+        self.depth = 0
+
+        segments = sorted(glob.glob(glob.escape(path) + '.[0-9][0-9][0-9][0-9]'))
+        self.index = int(segments[-1][-4:]) + 1 if segments else 0
+        self._map = None
+        self._open_segment()
+
+    def _open_segment(self,):
+        with open(_segment_path(self.path, self.index), 'w+b') as f:
+            f.truncate(self.segment_size)
+            self._map = mmap.mmap(f.fileno(), self.segment_size)
+        self._map[:len(MAGIC)] = MAGIC
+        self._pos = len(MAGIC)
+
+        old = self.index - self.max_segments
+        if old >= 0 and os.path.exists(_segment_path(self.path, old)):
+            os.remove(_segment_path(self.path, old))
+
+    def _rotate(self,):
+        self._map.flush()
+        self._map.close()
+        self.index += 1
+        self._open_segment()
+
+    def append(self, kind, payload):
+        """Appends one record of kind with the bytes payload. """
+
+        size = _header.size + len(payload)
+        assert size + _header.size <= self.segment_size - len(MAGIC), 'Record larger than journal segment.'
+        if self._pos + size + _header.size > self.segment_size:
+            self._rotate()
+
+        _header.pack_into(self._map, self._pos, kind, time.monotonic() - self.t0, len(payload))
+        self._map[self._pos + _header.size:self._pos + size] = payload
+        self._pos += size
+
+    def call(self, name, args, kwargs):
+        self.append(CALL, json.dumps([name, args, kwargs], default=_to_json).encode())
+
+    def gpio(self, pins, values):
+        if type(pins) not in (list, tuple):
+            pins = [pins]
+        if type(values) not in (list, tuple):
+            values = [values]*len(pins)
+        self.append(GPIO, bytes(b for pin, value in zip(pins, values) for b in (pin, int(bool(value)))))
+
+    def close(self,):
+        """Flushes the current segment and closes the journal. """
+
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+
+
+class JournalSpi():
+    """Wraps a spidev.SpiDev-like backend and records all transfers in a journal. """
+
+    def __init__(self, spi, journal):
+        object.__setattr__(self, 'spi', spi)
+        object.__setattr__(self, 'journal', journal)
+
+    def __getattr__(self, name):
+        return getattr(self.spi, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.spi, name, value)
+
+    def writebytes(self, data):
+        self.journal.append(SPI_WRITE, bytes(data))
+        self.spi.writebytes(data)
+
+    def writebytes2(self, data):
+        self.journal.append(SPI_WRITE, bytes(data))
+        self.spi.writebytes2(data)
+
+    def xfer2(self, data):
+        self.journal.append(SPI_XFER, bytes(data))
+        return self.spi.xfer2(data)
+
+    def readbytes(self, n):
+        self.journal.append(SPI_READ, struct.pack('<I', n))
+        return self.spi.readbytes(n)
+
+
+class JournalGpio():
+    """Wraps a RPi.GPIO-like backend and records all output edges in a journal. """
+
+    def __init__(self, gpio, journal):
+        self.gpio = gpio
+        self.journal = journal
+
+    def __getattr__(self, name):
+        return getattr(self.gpio, name)
+
+    def output(self, pins, values):
+        self.journal.gpio(pins, values)
+        self.gpio.output(pins, values)
+
+    def pulse(self, pin):
+        self.journal.gpio([pin, pin], [1, 0])
+        pulse = getattr(self.gpio, 'pulse', None)
+        if pulse is not None:
+            pulse(pin)
+        else:
+            self.gpio.output(pin, 1)
+            self.gpio.output(pin, 0)
+
+
+def read_journal(path):
+    """Yields all records (kind, time, payload) of all segments of path in order. """
+
+    segments = sorted(glob.glob(glob.escape(path) + '.[0-9][0-9][0-9][0-9]'))
+    for segment in segments:
+        with open(segment, 'rb') as f:
+            data = f.read()
+        assert data[:len(MAGIC)] == MAGIC, '%r is not an AD9959 journal.' % segment
+
+        pos = len(MAGIC)
+        while pos + _header.size <= len(data):
+            kind, t, size = _header.unpack_from(data, pos)
+            if kind == END:
+                break
+            pos += _header.size
+            yield kind, t, data[pos:pos + size]
+            pos += size
+
+
+def replay(path, dds=None, spi=None, gpio=None, speed='original', level='frames'):
+    """Replays a journal.
+
+    ### Arguments
+    * `path` -- Path of the journal as passed to `AD9959.enable_journal`.
+    * `dds` -- AD9959 instance used for `level='calls'`.
+    * `spi`, `gpio` -- Backends used for `level='frames'`.
+    * `speed` -- 'original' keeps the recorded timing, 'max' replays as fast as possible.
+    * `level` -- 'frames' re-issues SPI frames and GPIO edges, 'calls' re-issues public calls.
+
+    ### Returns
+    (number of replayed records, duration in s)
+    """
+
+    assert speed in ['original', 'max'], "speed must be 'original' or 'max'"
+    assert level in ['frames', 'calls'], "level must be 'frames' or 'calls'"
+
+    n = 0
+    t_start = time.monotonic()
+    t_first = None
+
+    for kind, t, payload in read_journal(path):
+        if (kind == CALL) != (level == 'calls'):
+            continue
+
+        if speed == 'original':
+            if t_first is None:
+                t_first = t
+            delay = t_start + t - t_first - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        if kind == CALL:
+            try:
+                name, args, kwargs = json.loads(payload.decode(), object_hook=_from_json)
+            except Unreplayable as e:
+                warn('Skipped a call with the argument %s, which is only replayed at frame level.' % e.args[0])
+                continue
+            getattr(dds, name)(*args, **kwargs)
+        elif kind == SPI_WRITE:
+            spi.writebytes2(list(payload))
+        elif kind == SPI_XFER:
+            spi.xfer2(list(payload))
+        elif kind == SPI_READ:
+            spi.readbytes(struct.unpack('<I', payload)[0])
+        elif kind == GPIO:
+            gpio.output(list(payload[0::2]), list(payload[1::2]))
+        n += 1
+
+    return n, time.monotonic() - t_start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay an AD9959 journal.')
+    parser.add_argument('path', help='journal path as passed to AD9959.enable_journal')
+    parser.add_argument('--target', choices=['sim', 'hardware'], default='sim')
+    parser.add_argument('--speed', choices=['original', 'max'], default='original')
+    parser.add_argument('--level', choices=['frames', 'calls'], default='frames')
+    args = parser.parse_args()
+
+    if args.target == 'sim':
+        from AD9959Sim import open_sim
+        spi, gpio = open_sim()
+    else:
+        from AD9959 import open_hardware
+        spi, gpio = open_hardware()
+
+    dds = None
+    if args.level == 'calls':
+        from AD9959 import AD9959
+        dds = AD9959(spi=spi, gpio=gpio)
+
+    n, dt = replay(args.path, dds=dds, spi=spi, gpio=gpio, speed=args.speed, level=args.level)
+    print('Replayed %d records in %.3f s (%.0f records/s)' % (n, dt, n/dt if dt > 0 else float('inf')))
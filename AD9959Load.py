@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+
+"""Load and soak test of the server against the simulated device.
+
+# Overview
+Starts the server of `AD9959Http.py` with the simulated SPI and GPIO backends of `AD9959Sim.py` (`AD9959_SIM=1`) in this process and drives it over HTTP from many concurrent clients. The clients run as threads in several worker processes, so they do not compete with the server for the GIL of the server process. Each client repeatedly picks an endpoint from a weighted mix (see `ENDPOINTS`), sends the request and records its latency. Polling clients send the ETag of their last response as If-None-Match, like the web interface.
+
+After every report interval the throughput, the p50/p99/p999 latency and the number of errors (failed connections, HTTP status >= 400 and `{"error": ...}` responses) are printed, and the register file of the simulated device is compared to the state reported by `/outputs` (see `check_consistency`). At the end the totals per endpoint are printed.
+
+### Usage
+Run from the directory of the server (it reads and writes `static/`):
+```
+python AD9959Load.py [--clients 50] [--processes 4] [--duration 60] [--interval 10] [--mix outputs:50,set_frequency:2,set_amplitude:2]
+```
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
+import urllib.parse
+import numpy as np
+
+#Endpoints of the server: name -> function(rng) returning (method, path, form data)
+ENDPOINTS = {
+'outputs'           :lambda rng: ('GET', '/outputs', None),
+'index'             :lambda rng: ('GET', '/', None),
+'presets'           :lambda rng: ('GET', '/presets', None),
+'scheduler'         :lambda rng: ('GET', '/scheduler', None),
+'set_frequency'     :lambda rng: ('GET', '/set_frequency?%d=%d' % (rng.randrange(4), rng.uniform(1e6, 100e6)), None),
+'set_frequency_ui'  :lambda rng: ('GET', '/set_frequency?%d=%d&priority=ui' % (rng.randrange(4), rng.uniform(1e6, 100e6)), None),
+'set_amplitude'     :lambda rng: ('GET', '/set_amplitude?%d=%.3f' % (rng.randrange(4), rng.uniform(0.01, 1)), None),
+'set_apf'           :lambda rng: _set_apf(rng),
+}
+
+DEFAULT_MIX = 'outputs:50,index:5,set_frequency:2,set_amplitude:2,set_frequency_ui:1'
+
+
+def _set_apf(rng):
+    channel = rng.randrange(4)
+    form = {'frequency_%d' % channel: '%.3f' % rng.uniform(1, 100),
+            'amplitude_%d' % channel: '%.1f' % rng.uniform(1, 100),
+            'phase_%d' % channel: '%.1f' % rng.uniform(0, 360)}
+    return 'POST', '/set_apf/%d' % channel, urllib.parse.urlencode(form)
+
+
+def parse_mix(mix):
+    """Returns the dict {<endpoint>: <weight>} of a mix string '<endpoint>:<weight>,...'. """
+
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition(':')
+        name = name.strip()
+        assert name in ENDPOINTS, 'Unknown endpoint <%s>, use one of %r' % (name, list(ENDPOINTS))
+        weights[name] = float(weight) if weight else 1.0
+
+    return weights
+
+
+def _request(connection, method, path, body, etag=None):
+    """Sends one request and returns (status, error message or None, ETag). """
+
+    headers = {}
+    if body is not None:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    if etag is not None:
+        headers['If-None-Match'] = etag
+
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    data = response.read()
+
+    error = None
+    if response.status >= 400:
+        error = 'HTTP %d' % response.status
+    elif data.startswith(b'{"error"'):
+        error = json.loads(data)['error']
+
+    return response.status, error, response.getheader('ETag')
+
+
+def _client(host, port, weights, deadline, think, seed, records, lock):
+    rng = random.Random(seed)
+    names = list(weights)
+    cumulative = np.cumsum([weights[name] for name in names]).tolist()
+    etags = {}
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+
+    while time.monotonic() < deadline:
+        name = rng.choices(names, cum_weights=cumulative)[0]
+        method, path, body = ENDPOINTS[name](rng)
+
+        t = time.perf_counter()
+        try:
+            status, error, etag = _request(connection, method, path, body, etags.get(path) if method == 'GET' else None)
+            if etag is not None:
+                etags[path] = etag
+        except (OSError, http.client.HTTPException) as e:
+            error = '%s: %s' % (type(e).__name__, e)
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+        latency = time.perf_counter() - t
+
+        with lock:
+            records.append((name, latency, error))
+
+        if think:
+            time.sleep(rng.expovariate(1/think))
+
+    connection.close()
+
+
+def _worker(host, port, clients, weights, duration, flush, think, seed, results):
+    """Runs clients threads in a worker process and puts their records into results every flush s. """
+
+    records = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=_client, args=(host, port, weights, deadline, think, seed*1000 + n, records, lock), daemon=True)
+               for n in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(flush)
+        with lock:
+            batch, records[:] = list(records), []
+        results.put(batch)
+
+    with lock:
+        results.put(list(records))
+    results.put(None)
+
+
+def start_server(host='127.0.0.1', port=0):
+    """Imports the server with the simulated device and serves it in a daemon thread.
+
+    ### Returns
+    (server module, port)
+    """
+
+    os.environ['AD9959_SIM'] = '1'
+    import AD9959Http
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    httpd = make_server(host, port, AD9959Http.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    return AD9959Http, httpd.server_port
+
+
+def check_consistency(server):
+    """Compares the register file of the simulated device with the state reported by `/outputs`.
+
+    # Function description
+    While holding the DDS lock of the server (no update in progress), the frequency tuning word of each channel (CFTW0, or CTW1 while a linear frequency sweep is ramped up by the channel pin), the phase offset word and the amplitude scale factor are read from the simulated registers and compared with the values reported by `/outputs`. With a flatness calibration the amplitude scale factor is compared with the one stored by the driver instead.
+
+    ### Returns
+    List of mismatch messages, empty if the state is consistent.
+    """
+
+    from AD9959 import _CHPINS
+
+    DDS = server.DDS
+    spi, gpio = DDS.spi, DDS.gpio
+    mismatches = []
+
+    with server.dds_lock:
+        reported = json.loads(server.app.test_client().get('/outputs').data)
+
+        for channel in range(4):
+            CFR = spi.registers(channel, 'CFR')
+            FTW = int.from_bytes(bytes(spi.registers(channel, 'CFTW0')), 'big')
+            if CFR[1] & 0x40 and CFR[0] >> 6 == 0b10 and gpio.input(_CHPINS[channel]):
+                FTW = int.from_bytes(bytes(spi.registers(channel, 'CTW1')), 'big')
+            POW = int.from_bytes(bytes(spi.registers(channel, 'CPOW0')), 'big') & 0x3FFF
+            ACR = spi.registers(channel, 'ACR')
+            ASF = (ACR[1] & 0x03) << 8 | ACR[2] if ACR[1] & 0x10 else 2**10 - 1
+
+            output = reported[str(channel)]
+            expected_ASF = round(output['amplitude']/100*(2**10 - 1)) if DDS.calibration is None else DDS.states[channel].ASF
+            for var, word, expected, modulus in [('frequency', FTW, round(output['frequency']*2**32/DDS.clock_freq), 2**32),
+                                                 ('phase', POW, round(output['phase']*2**14/360), 2**14),
+                                                 ('amplitude', ASF, expected_ASF, None)]:
+                difference = word - expected if modulus is None else (word - expected + modulus//2) % modulus - modulus//2
+                if abs(difference) > 1:
+                    mismatches.append('channel %d %s: register word %d, reported %r (word %d)' % (channel, var, word, output[var], expected))
+
+    return mismatches
+
+
+def _summary(latencies, errors, dt):
+    if not len(latencies):
+        return '%8d req %9.1f req/s' % (0, 0)
+    p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9])*1e3
+    return '%8d req %9.1f req/s  p50 %8.2f ms  p99 %8.2f ms  p999 %8.2f ms  %6d errors' % (len(latencies), len(latencies)/dt, p50, p99, p999, errors)
+
+
+def run(server, port, weights, clients=50, processes=4, duration=60, interval=10, think=0, seed=0, host='127.0.0.1'):
+    """Runs the load test and prints a report after every interval and at the end.
+
+    ### Arguments
+    * `server` -- Server module (see `start_server`), None to skip the consistency checks (e.g. for a server on the hardware).
+    * `weights` -- dict {<endpoint>: <weight>} (see `parse_mix`).
+    * `clients` -- Number of concurrent clients, distributed over processes worker processes.
+    * `think` -- Mean pause of each client between two requests in s (exponentially distributed).
+
+    ### Returns
+    dict {'requests', 'errors', 'mismatches', 'throughput', 'endpoints': {<endpoint>: {'requests', 'errors', 'p50', 'p99', 'p999'}}} with latencies in s.
+    """
+
+    processes = max(1, min(processes, clients))
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    workers = [context.Process(target=_worker, args=(host, port, clients//processes + (n < clients % processes), weights, duration,
+                                                     min(interval, 0.25), think, seed*100 + n, results), daemon=True)
+               for n in range(processes)]
+
+    latencies = {name: [] for name in weights}
+    errors = {name: 0 for name in weights}
+    samples = {}
+    mismatches = 0
+    running = len(workers)
+
+    start = time.monotonic()
+    for worker in workers:
+        worker.start()
+
+    last = start
+    batch = []
+    while running:
+        try:
+            records = results.get(timeout=0.1)
+        except queue.Empty:
+            records = []
+        if records is None:
+            running -= 1
+        else:
+            batch += records
+
+        now = time.monotonic()
+        if now - last < interval and running:
+            continue
+
+        for name, latency, error in batch:
+            latencies[name].append(latency)
+            if error is not None:
+                errors[name] += 1
+                samples.setdefault(error, 0)
+                samples[error] += 1
+
+        interval_mismatches = check_consistency(server) if server is not None else []
+        mismatches += len(interval_mismatches)
+        print('%7.1f s %s  %d mismatches' % (now - start, _summary([latency for name, latency, error in batch], sum(error is not None for name, latency, error in batch), now - last), len(interval_mismatches)))
+        for message in interval_mismatches:
+            print('    ' + message)
+        batch = []
+        last = now
+
+    for worker in workers:
+        worker.join()
+    dt = time.monotonic() - start
+
+    print('\nTotal (%d clients, %.1f s)' % (clients, dt))
+    report = {'requests': 0, 'errors': 0, 'mismatches': mismatches, 'endpoints': {}}
+    for name in weights:
+        values = np.array(latencies[name])
+        print('%-17s %s' % (name, _summary(values, errors[name], dt)))
+        p50, p99, p999 = np.percentile(values, [50, 99, 99.9]) if len(values) else (None, None, None)
+        report['endpoints'][name] = {'requests': len(values), 'errors': errors[name], 'p50': p50, 'p99': p99, 'p999': p999}
+        report['requests'] += len(values)
+        report['errors'] += errors[name]
+    print('%-17s %s' % ('all', _summary(np.concatenate([latencies[name] for name in weights]), report['errors'], dt)))
+    report['throughput'] = report['requests']/dt
+
+    for error, n in sorted(samples.items(), key=lambda item: -item[1])[:10]:
+        print('%6d x %s' % (n, error))
+    print('%d consistency mismatches' % mismatches)
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load and soak test of AD9959Http against the simulated device.')
+    parser.add_argument('--clients', type=int, default=50, help='number of concurrent clients')
+    parser.add_argument('--processes', type=int, default=4, help='number of client processes')
+    parser.add_argument('--duration', type=float, default=60, help='test duration in s')
+    parser.add_argument('--interval', type=float, default=10, help='report interval in s')
+    parser.add_argument('--think', type=float, default=0, help='mean pause of each client between requests in s')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='weighted endpoints <endpoint>:<weight>,... out of %s' % ', '.join(ENDPOINTS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--server', help='URL of a running server to test instead (no consistency checks), e.g. http://localhost:5000')
+    args = parser.parse_args()
+
+    if args.server:
+        url = urllib.parse.urlsplit(args.server)
+        server, host, port = None, url.hostname, url.port or 80
+    else:
+        host = '127.0.0.1'
+        server, port = start_server(host)
+
+    report = run(server, port, parse_mix(args.mix), clients=args.clients, processes=args.processes, duration=args.duration,
+                 interval=args.interval, think=args.think, seed=args.seed, host=host)
+    exit(1 if report['errors'] or report['mismatches'] else 0)
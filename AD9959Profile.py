@@ -0,0 +1,135 @@
+"""Sampling profiler for the running server.
+
+# Overview
+A `SamplingProfiler` samples the Python stacks of all threads of the process (`sys._current_frames`) at a fixed interval in a background thread for a bounded time window and counts identical stacks. The result is written in the collapsed stack format (one line `<thread>;<frame>;<frame>... <count>` per stack, outermost frame first), which is read directly by flamegraph.pl, speedscope and inferno.
+
+Frames are labeled `<module>:<function>`. Calls of the AD9959 driver, which access the bus and the pins (`DRIVER_CALLS`), are labeled `<module>:<function> [driver]`, so the time spent in SPI and GPIO accesses stands out in the flame graph.
+
+Nothing is installed in the interpreter (no trace or profile hooks): when no profile is running, the profiler costs nothing. While it runs, the sampling thread takes the GIL once per interval.
+
+### Usage
+```python
+from AD9959Profile import SamplingProfiler
+profiler = SamplingProfiler()
+profiler.start(duration=10)
+...
+profiler.wait()
+open('server.folded', 'w').write(profiler.collapsed())
+```
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+
+#Functions of the AD9959 class labeled as driver calls
+DRIVER_CALLS = ['set_output', '_write', '_read', '_toggle_pin']
+
+MAX_DURATION = 60
+
+
+class SamplingProfiler():
+    """Samples the stacks of all threads for a bounded time window. """
+
+    def __init__(self, driver_module='AD9959', driver_calls=DRIVER_CALLS):
+        """Constructor.
+
+        ### Arguments
+        * `driver_module` -- Module name (file name without .py) of the driver.
+        * `driver_calls` -- Function names of the driver labeled with `[driver]`.
+        """
+
+        self.driver_module = driver_module
+        self.driver_calls = set(driver_calls)
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.interval = None
+        self.started = None
+        self.stopped = None
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def running(self,):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration=10, interval=5e-3):
+        """Discards the previous profile and samples all threads every interval (in s) for duration (in s, at most `MAX_DURATION`). """
+
+        assert not self.running(), 'The profiler is already running'
+        assert 0 < duration <= MAX_DURATION, 'duration must be between 0 and %d s' % MAX_DURATION
+        assert 1e-4 <= interval <= 1, 'interval must be between 0.1 ms and 1 s'
+
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.interval = interval
+        self.started = time.time()
+        self.stopped = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(duration, interval), name='SamplingProfiler', daemon=True)
+        self._thread.start()
+
+    def stop(self,):
+        """Stops sampling before the end of the window. """
+
+        self._stop.set()
+        self.wait()
+
+    def wait(self, timeout=None):
+        """Blocks until the window has ended. """
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self,):
+        """Returns dict {'running', 'started', 'stopped', 'interval', 'samples', 'stacks', 'driver_samples'}, started and stopped as unix time. """
+
+        stacks = self.stacks.copy()
+        return {'running': self.running(), 'started': self.started, 'stopped': self.stopped, 'interval': self.interval,
+                'samples': self.samples, 'stacks': len(stacks),
+                'driver_samples': sum(count for stack, count in stacks.items() if '[driver]' in stack)}
+
+    def collapsed(self,):
+        """Returns the profile in the collapsed stack format. """
+
+        return ''.join('%s %d\n' % (stack, count) for stack, count in sorted(self.stacks.copy().items()))
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            name = getattr(code, 'co_qualname', code.co_name)
+            label = ('%s:%s' % (module, name)).replace(';', ':')
+            if module == self.driver_module and code.co_name in self.driver_calls:
+                label += ' [driver]'
+            self._labels[code] = label
+        return label
+
+    def _run(self, duration, interval):
+        own = threading.get_ident()
+        deadline = time.perf_counter() + duration
+        next_sample = time.perf_counter()
+
+        while not self._stop.is_set():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, 'thread-%d' % ident).replace(';', ':'))
+                self.stacks[';'.join(reversed(stack))] += 1
+            del frame
+            self.samples += 1
+
+            next_sample += interval
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            self._stop.wait(max(next_sample - now, 0))
+
+        self.stopped = time.time()
@@ -0,0 +1,239 @@
+"""Shared-memory state and command ring for local clients of the AD9959.
+
+# Overview
+The process owning the hardware (e.g. the server in `AD9959Http.py`) publishes the state of all channels in a memory-mapped file (by default in /dev/shm) with a `ShmServer`. Local processes read it with a `ShmClient` without any syscalls and send commands through a lock-free single-producer/single-consumer ring in the same file. Use one `ShmClient` per file, the ring supports only a single producer.
+
+### Segment layout
+* Header `<8sIIQ` -- `MAGIC`, seqlock counter, ring capacity, generation (see `AD9959.generation`)
+* Ring header `<IIII` -- head (written by the client), tail, id of the last executed command and id of the last failed command (written by the server)
+* 4 channel records `_channel` -- frequency, phase, amplitude, current divider, FTW, POW, ASF, sweep type, ramp direction, ramp deadline (time.monotonic() seconds)
+* Ring of `capacity` commands `_command` -- id, channel mask, var, value
+
+The state is protected by a seqlock: the server makes the counter odd while writing and even again afterwards, readers retry until they copied the state with the same even counter before and after.
+
+### Commands and the HTTP scheduler
+Commands of the ring are executed directly with `AD9959.set_output` while holding the server's lock, bypassing the priority `Scheduler` of `AD9959Http.py` on purpose, which would add its queueing and collection windows to the latency. They are neither collapsed nor counted in `/scheduler` and are executed between two scheduler updates, i.e. with the priority of the fastest client. A frequency ramp started by the scheduler is not aborted by a command, its channel just gets the new value once the ramp has released the lock.
+
+### Permissions
+The segment is created with the permissions `mode` of the `ShmServer` (0o666 by default, independent of the umask), so clients of other users can open it read-write.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b'AD9959S1'
+
+_header = struct.Struct('<8sIIQ')
+_ring_header = struct.Struct('<IIII')
+_channel = struct.Struct('<dddIIIIBB6xd')
+_command = struct.Struct('<IBBxxd')
+
+_SEQ_OFFSET = 8
+_RING_OFFSET = _header.size
+_HEAD_OFFSET = _RING_OFFSET
+_TAIL_OFFSET = _RING_OFFSET + 4
+_STATE_OFFSET = _RING_OFFSET + _ring_header.size
+_SLOTS_OFFSET = 320
+
+_vars = ['frequency', 'phase', 'amplitude']
+_sweep_types = [None, 'frequency', 'amplitude', 'phase']
+_directions = [None, 'RU', 'RD']
+
+
+def _open(path, size, create, mode=0o666):
+    flags = os.O_RDWR | (os.O_CREAT if create else 0)
+    fd = os.open(path, flags, mode)
+    try:
+        if create:
+            # the mode of os.open is reduced by the umask
+            os.fchmod(fd, mode)
+            os.ftruncate(fd, size)
+        else:
+            size = os.fstat(fd).st_size
+        return mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+    finally:
+        os.close(fd)
+
+
+class ShmServer():
+    """Publishes the channel states of an AD9959 and executes the commands of the ring. """
+
+    def __init__(self, dds, path='/dev/shm/ad9959', capacity=256, lock=None, mode=0o666):
+        """Constructor. Creates (or resets) the segment file at path.
+
+        ### Arguments
+        * `dds` -- AD9959 instance.
+        * `capacity` -- Number of command slots of the ring, a power of 2 (the 32 bit head and tail counters wrap around).
+        * `lock` -- Lock held while accessing dds, e.g. shared with other threads using it.
+        * `mode` -- Permissions of the segment file, e.g. 0o660 to restrict the clients to the group of the server.
+        """
+
+        assert capacity > 0 and capacity & (capacity - 1) == 0, 'capacity must be a power of 2'
+
+        self.dds = dds
+        self.path = path
+        self.capacity = capacity
+        self.lock = lock if lock is not None else threading.RLock()
+        self._map = _open(path, _SLOTS_OFFSET + capacity*_command.size, create=True, mode=mode)
+        self._map[:_SLOTS_OFFSET] = bytes(_SLOTS_OFFSET)
+        _header.pack_into(self._map, 0, MAGIC, 0, capacity, 0)
+        self._seq = 0
+        self._published = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.publish()
+
+    def publish(self,):
+        """Writes the current channel states into the segment. """
+
+        with self.lock:
+            offset = time.monotonic() - time.perf_counter()
+            records = []
+            for state in self.dds.states:
+                sweep = state.sweep['type'] if state.sweep is not None else None
+                records.append((state.frequency, state.phase, state.amplitude, state.current, state.FTW, state.POW, state.ASF,
+                                _sweep_types.index(sweep), _directions.index(state.ramp_direction), state.ramp_deadline + offset))
+            generation = self.dds.generation
+
+        self._seq += 1
+        struct.pack_into('<I', self._map, _SEQ_OFFSET, self._seq)
+        struct.pack_into('<Q', self._map, _SEQ_OFFSET + 8, generation)
+        for channel, record in enumerate(records):
+            _channel.pack_into(self._map, _STATE_OFFSET + channel*_channel.size, *record)
+        self._seq += 1
+        struct.pack_into('<I', self._map, _SEQ_OFFSET, self._seq)
+
+        self._published = generation
+
+    def poll(self,):
+        """Executes all commands in the ring and republishes the state if it changed.
+
+        ### Returns
+        Number of executed commands.
+        """
+
+        head, tail, done, failed = _ring_header.unpack_from(self._map, _RING_OFFSET)
+        n = 0
+        while tail != head:
+            id, mask, var, value = _command.unpack_from(self._map, _SLOTS_OFFSET + (tail % self.capacity)*_command.size)
+            channels = [channel for channel in range(4) if mask >> channel & 1]
+            try:
+                with self.lock:
+                    self.dds.set_output(channels, value, _vars[var], io_update=True)
+            except Exception:
+                # e.g. invalid or non-finite values, the server keeps serving
+                failed = id
+            done = id
+            tail = (tail + 1) & 0xFFFFFFFF
+            n += 1
+
+        if n:
+            struct.pack_into('<II', self._map, _TAIL_OFFSET + 4, done, failed)
+            struct.pack_into('<I', self._map, _TAIL_OFFSET, tail)
+        if n or self.dds.generation != self._published:
+            self.publish()
+
+        return n
+
+    def serve(self, idle=20e-6, max_idle=1e-3):
+        """Polls the ring until `stop` is called.
+
+        While there is nothing to do, the sleep between polls doubles from idle to max_idle (in s), so a busy client is served within microseconds while an idle ring costs little CPU time.
+        """
+
+        sleep = idle
+        while not self._stop.is_set():
+            if self.poll():
+                sleep = idle
+            else:
+                time.sleep(sleep)
+                sleep = min(2*sleep, max_idle)
+
+    def start(self, idle=20e-6, max_idle=1e-3):
+        """Runs `serve` in a daemon thread. """
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.serve, args=(idle, max_idle), daemon=True)
+        self._thread.start()
+
+    def stop(self,):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class ShmClient():
+    """Reads the published state and sends commands to a `ShmServer`. """
+
+    def __init__(self, path='/dev/shm/ad9959'):
+        self._map = _open(path, 0, create=False)
+        magic, seq, self.capacity, generation = _header.unpack_from(self._map, 0)
+        assert magic == MAGIC, '%r is not an AD9959 state segment.' % path
+
+    def state(self,):
+        """Returns a consistent copy of the published state.
+
+        ### Returns
+        dict {'generation': <generation>, 'channels': [{'frequency', 'phase', 'amplitude', 'current', 'FTW', 'POW', 'ASF', 'sweep', 'ramp_direction', 'ramp_deadline'}, ...]}
+        """
+
+        while True:
+            seq = struct.unpack_from('<I', self._map, _SEQ_OFFSET)[0]
+            if seq & 1:
+                continue
+            data = self._map[:_SLOTS_OFFSET]
+            if struct.unpack_from('<I', self._map, _SEQ_OFFSET)[0] == seq:
+                break
+
+        channels = []
+        for channel in range(4):
+            record = _channel.unpack_from(data, _STATE_OFFSET + channel*_channel.size)
+            channels.append({'frequency': record[0], 'phase': record[1], 'amplitude': record[2], 'current': record[3],
+                             'FTW': record[4], 'POW': record[5], 'ASF': record[6], 'sweep': _sweep_types[record[7]],
+                             'ramp_direction': _directions[record[8]], 'ramp_deadline': record[9]})
+
+        return {'generation': struct.unpack_from('<Q', data, _SEQ_OFFSET + 8)[0], 'channels': channels}
+
+    def submit(self, channels, var, value):
+        """Queues a `AD9959.set_output(channels, value, var, io_update=True)` call.
+
+        ### Returns
+        Id of the command (see `wait`), None if the ring is full.
+        """
+
+        if type(channels) is int:
+            channels = [channels]
+        mask = 0
+        for channel in channels:
+            assert channel in [0, 1, 2, 3], 'channels must be between 0, 1, 2 or 3'
+            mask |= 1 << channel
+        assert var in _vars, "var must be 'frequency', 'phase' or 'amplitude'"
+
+        head, tail = struct.unpack_from('<II', self._map, _HEAD_OFFSET)
+        if (head - tail) & 0xFFFFFFFF >= self.capacity:
+            return None
+
+        id = (head + 1) & 0xFFFFFFFF
+        _command.pack_into(self._map, _SLOTS_OFFSET + (head % self.capacity)*_command.size, id, mask, _vars.index(var), value)
+        struct.pack_into('<I', self._map, _HEAD_OFFSET, id)
+
+        return id
+
+    def wait(self, id, timeout=1):
+        """Spins until the command id has been executed.
+
+        ### Returns
+        True if it was executed successfully, False if it failed. Raises TimeoutError after timeout (in s).
+        """
+
+        deadline = time.monotonic() + timeout
+        while True:
+            done, failed = struct.unpack_from('<II', self._map, _TAIL_OFFSET + 4)
+            if (done - id) & 0xFFFFFFFF < 2**31:
+                return failed != id
+            if time.monotonic() > deadline:
+                raise TimeoutError('Command %d was not executed within %r s.' % (id, timeout))
@@ -0,0 +1,157 @@
+"""Simulated SPI and GPIO backends for the AD9959.
+
+# Overview
+Allows running `AD9959` (and the server in `AD9959Http.py`) without a RPi and an eval board, e.g. for replaying journals (see `AD9959Journal.py`) or load tests. Use
+```python
+from AD9959 import AD9959
+from AD9959Sim import open_sim
+spi, gpio = open_sim()
+dds = AD9959(spi=spi, gpio=gpio)
+```
+
+The simulated device decodes the SPI byte stream into instruction and data bytes and keeps the register file of all 4 channels. Register writes take effect immediately (the IO update is only counted), reads return the stored register values.
+"""
+
+from AD9959 import _registers, _register_len, _global_registers, _addresses, IOUPDATE_PIN, RESET_PIN
+
+
+class SimSpi():
+    """Simulated spidev.SpiDev connected to an AD9959. """
+
+    def __init__(self, gpio=None):
+        """Constructor. If the simulated gpio is given, its RESET pin resets the register file. """
+
+        self.max_speed_hz = 500000
+        self.mode = 0
+        self.bytes_transferred = 0
+        self.reset()
+
+        if gpio is not None:
+            gpio.spi = self
+
+    def reset(self,):
+        """Sets all registers to their default values. """
+
+        self.global_registers = {register: [0]*_register_len[register] for register in _global_registers}
+        self.global_registers['CSR'] = [0xF0]
+        self.channel_registers = [{register: [0]*_register_len[register] for register in _registers if register not in _global_registers}
+                                  for channel in range(4)]
+        for registers in self.channel_registers:
+            # full scale DAC current (CFR[9:8]=11)
+            registers['CFR'] = [0x00, 0x03, 0x02]
+
+        self._instruction = None
+        self._data = []
+
+    def registers(self, channel, register):
+        """Returns the stored bytes of register as seen with only channel selected. """
+
+        if register in _global_registers:
+            return self.global_registers[register]
+        return self.channel_registers[channel][register]
+
+    def _selected(self, register):
+        if register in _global_registers:
+            return [self.global_registers]
+        channels = self.global_registers['CSR'][0] >> 4
+        return [self.channel_registers[channel] for channel in range(4) if channels >> channel & 1]
+
+    def _clock(self, byte):
+        """Clocks one byte into the device and returns the byte clocked out. """
+
+        self.bytes_transferred += 1
+
+        if self._instruction is None:
+            self._instruction = byte
+            self._data = []
+            register = _addresses[byte & 0x1F]
+            if byte & 0x80:
+                selected = self._selected(register)
+                self._data = list(selected[0][register]) if selected else [0]*_register_len[register]
+            return 0
+
+        register = _addresses[self._instruction & 0x1F]
+        if self._instruction & 0x80:
+            out = self._data.pop(0)
+            if not self._data:
+                self._instruction = None
+            return out
+
+        self._data.append(byte)
+        if len(self._data) == _register_len[register]:
+            for registers in self._selected(register):
+                registers[register] = list(self._data)
+            self._instruction = None
+        return 0
+
+    def open(self, bus, device):
+        pass
+
+    def close(self,):
+        pass
+
+    def writebytes(self, data):
+        for byte in data:
+            self._clock(byte)
+
+    def writebytes2(self, data):
+        self.writebytes(data)
+
+    def readbytes(self, n):
+        return [self._clock(0) for i in range(n)]
+
+    def xfer2(self, data):
+        return [self._clock(byte) for byte in data]
+
+
+class SimGPIO():
+    """Simulated RPi.GPIO module. Keeps the level of every pin and counts IO updates. """
+
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self,):
+        """Constructor. """
+
+        self.levels = {}
+        self.io_updates = 0
+        self.spi = None
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pins, direction, **kwargs):
+        pass
+
+    def output(self, pins, values):
+        if type(pins) not in (list, tuple):
+            pins = [pins]
+        if type(values) not in (list, tuple):
+            values = [values]*len(pins)
+
+        for pin, value in zip(pins, values):
+            rising = value and not self.levels.get(pin, 0)
+            self.levels[pin] = int(bool(value))
+            if rising and pin == IOUPDATE_PIN:
+                self.io_updates += 1
+            elif rising and pin == RESET_PIN and self.spi is not None:
+                self.spi.reset()
+
+    def input(self, pin):
+        return self.levels.get(pin, 0)
+
+    def cleanup(self, *args):
+        pass
+
+
+def open_sim():
+    """Returns (spi, gpio) backends of a simulated AD9959 to be passed to the AD9959 constructor. """
+
+    gpio = SimGPIO()
+    spi = SimSpi(gpio)
+
+    return spi, gpio
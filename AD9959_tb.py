@@ -13,17 +13,16 @@ if __name__ == '__main__':
     dds.set_freqsweeptime(channels=0, start_freq=40e6, end_freq=80e6, sweeptime=1, no_dwell=False, ioupdate=True, trigger=False)
     dds.set_ramp_direction(channels=0, direction='RU')
 
-    time.sleep(1)
+    dds.wait_for_ramp(0)
     dds.set_output(channels=0, value=80e6, var='frequency', io_update=True)
     
     time.sleep(1)
     
     print('Ramp frequency down to 10 MHz')
-    dds.set_ramp_direction(channels=0, direction='RU')
-    dds.set_freqsweeptime(channels=0, start_freq=10e6, end_freq=80e6, sweeptime=1e-6, no_dwell=False, ioupdate=True, trigger=False)
-    dds.set_freqsweeptime(channels=0, start_freq=10e6, end_freq=80e6, sweeptime=1, no_dwell=False, ioupdate=True, trigger=False)
-    ## not sure here???
-    dds.set_ramp_direction(channels=0, direction='RD')
+    dds.ramp_frequency(channels=0, frequency=10e6, sweeptime=1).wait()
     time.sleep(1)
 
+    print('Ramp frequency back up to 80 MHz (channel pin only)')
+    dds.ramp_frequency(channels=0, frequency=80e6, sweeptime=1).wait()
+
     #dds.get_state(form='bin')
\ No newline at end of file
@@ -1,12 +1,4 @@
 #! /usr/bin/env bash
-echo '>Install c compiler...'
-sudo pacman -Syu glibc
-sudo pacman -Scc
-
-echo '>Enable clock output...'
-gcc minimal_clk.c -o minimal_clk
-sudo mv minimal_clk /usr/bin/minimal_clk
-
 echo '>Install required python libs...'
 sudo pip install flask_autodoc
 sudo pip install RPi.GPIO
@@ -0,0 +1,31 @@
+"""Fixtures for the tests, which run the driver against the simulated device of AD9959Sim.py. """
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from AD9959 import AD9959
+from AD9959Sim import open_sim
+
+
+@pytest.fixture
+def sim():
+    """Returns (dds, spi, gpio) of a freshly initialized simulated AD9959. """
+
+    spi, gpio = open_sim()
+    return AD9959(spi=spi, gpio=gpio), spi, gpio
+
+
+def ftw(dds, frequency):
+    """Returns the tuning word of frequency (in Hz) at the current clock frequency of dds. """
+
+    return int.from_bytes(bytes(dds._convert_frequency(frequency)), 'big')
+
+
+def register_files(spi):
+    """Returns a copy of all registers of the simulated device. """
+
+    return dict(spi.global_registers), [dict(registers) for registers in spi.channel_registers]
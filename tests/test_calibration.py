@@ -0,0 +1,59 @@
+from AD9959 import _amplitude_word
+from AD9959Calibration import FlatnessCalibration
+from conftest import ftw
+
+
+def calibrated(dds):
+    calibration = FlatnessCalibration()
+    calibration.set_table(0, [0, 100e6], [0, -6])
+    dds.set_calibration(calibration)
+    return calibration
+
+
+def asf(spi, channel):
+    acr = spi.registers(channel, 'ACR')
+    return (acr[1] & 0x03) << 8 | acr[2]
+
+
+def test_frequency_is_written(sim):
+    dds, spi, gpio = sim
+    calibration = calibrated(dds)
+
+    dds.set_output(0, 100e6, 'frequency', io_update=True)
+
+    assert int.from_bytes(bytes(spi.registers(0, 'CFTW0')), 'big') == ftw(dds, 100e6)
+    assert asf(spi, 0) == _amplitude_word(calibration.correction(0, 100e6, dds.clock_freq))
+
+
+def test_amplitude_is_leveled(sim):
+    dds, spi, gpio = sim
+    calibration = calibrated(dds)
+    dds.set_output(0, 0, 'frequency', io_update=True)
+
+    dds.set_output(0, 0.5, 'amplitude', io_update=True)
+
+    assert asf(spi, 0) == _amplitude_word(0.5*calibration.correction(0, 0, dds.clock_freq))
+    assert asf(spi, 0) < _amplitude_word(0.5)
+
+
+def test_amplitude_is_forced(sim):
+    dds, spi, gpio = sim
+    calibrated(dds)
+    dds.set_output(0, 100e6, 'frequency', io_update=True)
+    dds.set_output(0, 0.5, 'amplitude', io_update=True)
+    expected = list(spi.registers(0, 'ACR'))
+
+    spi.channel_registers[0]['ACR'] = [0, 0, 0]
+    dds.set_output(0, 0.5, 'amplitude', io_update=True)
+
+    assert spi.registers(0, 'ACR') == expected
+
+
+def test_uncalibrated_channels(sim):
+    dds, spi, gpio = sim
+    calibrated(dds)
+
+    dds.set_output(1, 0, 'frequency')
+    dds.set_output(1, 0.5, 'amplitude', io_update=True)
+
+    assert asf(spi, 1) == _amplitude_word(0.5)
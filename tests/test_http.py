@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_autodoc')
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    """Imports the server against the simulated device, with its settings and presets in a temporary directory. """
+
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('server'))
+    os.mkdir('static')
+    os.environ['AD9959_SIM'] = '1'
+    try:
+        import AD9959Http
+        yield AD9959Http
+    finally:
+        AD9959Http.shm.stop()
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+def test_updates(server, client):
+    data = json.loads(client.get('/set_frequency?0=1e6&1=2e6').data)
+
+    assert data['0']['frequency'] == 1e6
+    assert data['1']['frequency'] == 2e6
+    assert server.scheduler.results == {}
+
+
+def test_overload_is_all_or_nothing(server, client, monkeypatch):
+    monkeypatch.setitem(server.scheduler.limits, 'experiment', 2)
+    frequencies = server.DDS.frequencies
+
+    data = json.loads(client.get('/set_frequency?0=3e6&1=4e6&2=5e6').data)
+
+    assert 'error' in data
+    assert server.DDS.frequencies == frequencies
+    assert server.scheduler.results == {}
+    assert server.scheduler.waiting['experiment'] == 0
+    assert server.scheduler.pending['experiment'] == {}
+
+
+def test_failed_updates_are_collected(server):
+    tickets = server.scheduler.submit_all([('0', 'phase', 10), ('7', 'phase', 10)])
+
+    assert server.scheduler.results_all(tickets)
+    assert server.scheduler.results == {}
+
+
+def test_presets(server, client):
+    client.get('/set_frequency?0=10e6&3=30e6')
+    client.get('/save_preset?name=test')
+    client.get('/set_frequency?0=20e6&3=40e6')
+
+    data = json.loads(client.get('/recall_preset?name=test').data)
+
+    assert data['0']['frequency'] == 10e6
+    assert data['3']['frequency'] == 30e6
+    with open('static/presets.json') as f:
+        assert 'test' in json.load(f)
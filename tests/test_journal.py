@@ -0,0 +1,53 @@
+import numpy as np
+
+from AD9959 import AD9959
+from AD9959Calibration import FlatnessCalibration
+from AD9959Journal import replay
+from AD9959Sim import open_sim
+from conftest import register_files
+
+
+def record(dds, path):
+    """Records a few calls of every kind of argument in a journal at path. """
+
+    calibration = FlatnessCalibration()
+    calibration.set_table(2, [0, 100e6], [0, -3])
+
+    dds.enable_journal(path)
+    dds.set_output([0, 1], 12e6, 'frequency', io_update=True)
+    dds.set_output(1, 45, 'phase', io_update=True)
+    dds.set_current(2, 2)
+    dds.set_output_fast(dds.prepare_output(3, 0.25, 'amplitude'), io_update=True)
+    dds.set_calibration(calibration)
+    dds.set_output(2, 50e6, 'frequency', io_update=True)
+    dds.program_ramp(0, 12e6, 20e6, 1e-3)
+    dds.disable_journal()
+
+
+def test_replay_frames(sim, tmp_path):
+    dds, spi, gpio = sim
+    record(dds, str(tmp_path / 'journal'))
+
+    spi2, gpio2 = open_sim()
+    AD9959(spi=spi2, gpio=gpio2)
+    n, duration = replay(str(tmp_path / 'journal'), spi=spi2, gpio=gpio2, speed='max', level='frames')
+
+    assert n > 0
+    assert register_files(spi2) == register_files(spi)
+    assert gpio2.levels == gpio.levels
+
+
+def test_replay_calls(sim, tmp_path):
+    dds, spi, gpio = sim
+    record(dds, str(tmp_path / 'journal'))
+
+    spi2, gpio2 = open_sim()
+    dds2 = AD9959(spi=spi2, gpio=gpio2)
+    n, duration = replay(str(tmp_path / 'journal'), dds=dds2, speed='max', level='calls')
+
+    assert n == 8
+    assert register_files(spi2) == register_files(spi)
+    assert np.allclose(dds2.calibration.tables[2][1], [0, -3])
+    for state, state2 in zip(dds.states, dds2.states):
+        assert (state.frequency, state.phase, state.amplitude, state.current) == (state2.frequency, state2.phase, state2.amplitude, state2.current)
+        assert (state.FTW, state.POW, state.ASF) == (state2.FTW, state2.POW, state2.ASF)
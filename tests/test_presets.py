@@ -0,0 +1,63 @@
+from AD9959 import _CHPINS
+from conftest import ftw
+
+
+def test_recall_turns_off_sweep(sim):
+    dds, spi, gpio = sim
+    dds.set_output(0, 10e6, 'frequency', io_update=True)
+    dds.ramp_frequency(0, 20e6, 1e-3).wait()
+    dds.ramp_frequency(0, 5e6, 1e-3).wait()
+    image = dds.get_image()
+
+    dds.ramp_frequency(0, 30e6, 1e-3).wait()
+    dds.load_image(image)
+
+    cfr = spi.registers(0, 'CFR')
+    assert cfr[0] == 0 and cfr[1] & 0x40 == 0
+    assert int.from_bytes(bytes(spi.registers(0, 'CFTW0')), 'big') == ftw(dds, 5e6)
+    assert gpio.levels[_CHPINS[0]] == 0
+    assert dds.states[0].frequency == 5e6
+    assert dds.states[0].sweep is None
+
+
+def test_recall_restores_outputs(sim):
+    dds, spi, gpio = sim
+    dds.set_output(1, 42e6, 'frequency', io_update=True)
+    dds.set_output(1, 90, 'phase', io_update=True)
+    dds.set_output(1, 0.5, 'amplitude', io_update=True)
+    image = dds.get_image()
+    registers = {key: list(spi.registers(1, key)) for key in ['CFTW0', 'CPOW0', 'ACR']}
+
+    dds.set_output(1, 7e6, 'frequency')
+    dds.set_output(1, 0, 'phase')
+    dds.set_output(1, 1, 'amplitude', io_update=True)
+    io_updates = gpio.io_updates
+    dds.load_image(image, burst=dds.compile_image(image))
+
+    assert gpio.io_updates == io_updates + 1
+    assert {key: list(spi.registers(1, key)) for key in registers} == registers
+    assert (dds.states[1].frequency, dds.states[1].phase, dds.states[1].amplitude) == (42e6, 90, 0.5)
+
+
+def test_recall_restores_clock(sim):
+    dds, spi, gpio = sim
+    image = dds.get_image()
+
+    dds.set_freqmult(5)
+    assert dds.clock_freq == 250e6
+    dds.load_image(image)
+
+    assert dds.freqmult == 10
+    assert dds.clock_freq == 500e6
+    assert spi.registers(0, 'FR1') == image['FR1']
+
+
+def test_recall_is_one_burst(sim):
+    dds, spi, gpio = sim
+    image = dds.get_image()
+    burst = dds.compile_image(image)
+
+    transferred = spi.bytes_transferred
+    dds.load_image(image, burst=burst)
+
+    assert spi.bytes_transferred - transferred == len(burst)
@@ -0,0 +1,74 @@
+from AD9959 import _CHPINS, _current_bits, _amplitude_word
+from conftest import ftw
+
+
+def test_program_ramp_up(sim):
+    dds, spi, gpio = sim
+    dds.set_current(0, 2)
+    dds.set_output(0, 10e6, 'frequency', io_update=True)
+
+    io_updates = gpio.io_updates
+    dds.program_ramp(0, 10e6, 20e6, 1e-3, start='low')
+
+    cfr = spi.registers(0, 'CFR')
+    assert cfr[0] == 0x80
+    assert cfr[1] == 0x40 | _current_bits[2]
+    assert int.from_bytes(bytes(spi.registers(0, 'CFTW0')), 'big') == ftw(dds, 10e6)
+    assert int.from_bytes(bytes(spi.registers(0, 'CTW1')), 'big') == ftw(dds, 20e6)
+    assert gpio.io_updates == io_updates + 2
+    assert gpio.levels[_CHPINS[0]] == 0
+
+    sweep = dds.states[0].sweep
+    assert spi.registers(0, 'LSR') == [sweep['FSRR'], sweep['RSRR']]
+    assert int.from_bytes(bytes(spi.registers(0, 'RDW')), 'big') == sweep['RDW']
+
+
+def test_program_ramp_high_repairs_rising_ramp(sim):
+    dds, spi, gpio = sim
+    dds.program_ramp([1, 2], 10e6, 20e6, 1e-3, start='high')
+
+    for channel in [1, 2]:
+        sweep = dds.states[channel].sweep
+        assert spi.registers(channel, 'LSR') == [sweep['FSRR'], sweep['RSRR']]
+        assert int.from_bytes(bytes(spi.registers(channel, 'RDW')), 'big') == sweep['RDW']
+        assert gpio.levels[_CHPINS[channel]] == 1
+
+
+def test_program_ramp_is_verified(sim):
+    dds, spi, gpio = sim
+    dds.set_write_verify(registers=['CFR', 'CTW1'])
+
+    dds.program_ramp(0, 10e6, 20e6, 1e-3)
+
+    assert dds.verify_stats['checked'] == 2
+    assert dds.verify_stats['mismatches'] == 0
+    assert dds._verify_pending == {}
+
+
+def test_ramp_frequency_reuses_programmed_ramp(sim):
+    dds, spi, gpio = sim
+    dds.set_output(0, 10e6, 'frequency', io_update=True)
+    dds.ramp_frequency(0, 20e6, 1e-3).wait()
+
+    transferred = spi.bytes_transferred
+    dds.ramp_frequency(0, 10e6, 1e-3).wait()
+
+    assert spi.bytes_transferred == transferred
+    assert gpio.levels[_CHPINS[0]] == 0
+    assert dds.states[0].frequency == 10e6
+
+
+def test_amplitude_ramp(sim):
+    dds, spi, gpio = sim
+    dds.set_output([0, 1], 1, 'amplitude', io_update=True)
+
+    io_updates = gpio.io_updates
+    dds.set_output([0, 1], 0.2, 'amplitude', io_update=True, ramp_time=1e-3)
+
+    assert gpio.io_updates - io_updates == 10
+    for channel in [0, 1]:
+        acr = spi.registers(channel, 'ACR')
+        assert acr[1] & 0b00001000 == 0
+        assert (acr[1] & 0x03) << 8 | acr[2] == _amplitude_word(0.2)
+        assert dds.states[channel].ASF == _amplitude_word(0.2)
+    assert spi.global_registers['CSR'][0] >> 4 == 0b0011